@@ -1,20 +1,61 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from models import TokenData, UserDB
-from database import get_db
+from database import env_flag, get_db
 from sqlalchemy import select
+from cache import TTLCache
 
 # Настройки для JWT
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Настройки кэша пользователей и проверенных токенов
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL_SECONDS = 60
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
 # Настройки для хэширования паролей
-pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "sha256_crypt")
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "0")) or None  # None — значение passlib по умолчанию
+# Схемы, которыми могут быть захэшированы уже сохранённые пароли: по ним
+# пароль проверяется, пока при входе не будет перехэширован новой схемой
+PASSWORD_LEGACY_SCHEMES = [scheme.strip() for scheme in os.getenv("PASSWORD_LEGACY_SCHEMES", "sha256_crypt").split(",") if scheme.strip()]
+# перехэшировать при входе, если схема или rounds изменились
+PASSWORD_REHASH_ON_LOGIN = env_flag("PASSWORD_REHASH_ON_LOGIN", False)
+
+# Пул для хэширования: "process" (не держит GIL основного процесса) или "thread"
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "process")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))  # сверх этого числа ожидающих задач отвечаем 503
+
+# Новые пароли хэшируются схемой scheme, старые схемы помечены устаревшими.
+# min/max_rounds заставляют verify_and_update считать устаревшими и хэши
+# текущей схемы с другим числом rounds (default_rounds на это не влияет).
+def make_password_context(scheme: str, rounds: Optional[int] = None, legacy_schemes=()) -> CryptContext:
+    settings = {}
+    if rounds is not None:
+        for option in ("default_rounds", "min_rounds", "max_rounds"):
+            settings[f"{scheme}__{option}"] = rounds
+    schemes = [scheme] + [legacy for legacy in legacy_schemes if legacy != scheme]
+    return CryptContext(schemes=schemes, deprecated="auto", **settings)
+
+pwd_context = make_password_context(PASSWORD_HASH_SCHEME, PASSWORD_HASH_ROUNDS, PASSWORD_LEGACY_SCHEMES)
 
 # OAuth2 схема для авторизации
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -26,6 +67,79 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# Проверка пароля; второй элемент — новый хэш, если его нужно обновить
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    if PASSWORD_REHASH_ON_LOGIN:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    return pwd_context.verify(plain_password, hashed_password), None
+
+# Хэширование выполняется в отдельном пуле, чтобы не блокировать event loop
+_hash_executor: Optional[Executor] = None
+_hash_pending = 0
+_hash_rejected = 0
+
+def _get_hash_executor() -> Executor:
+    global _hash_executor
+    if _hash_executor is None:
+        if PASSWORD_HASH_EXECUTOR == "process":
+            # Пул создаётся в уже работающем сервере, где есть потоки event loop,
+            # aiosqlite и миниатюр; fork унаследовал бы их захваченные блокировки
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _hash_executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                                 mp_context=multiprocessing.get_context(method))
+        else:
+            _hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwd-hash")
+    return _hash_executor
+
+def _discard_hash_executor(executor: Executor):
+    global _hash_executor
+    if _hash_executor is executor:
+        _hash_executor = None
+        executor.shutdown(wait=False)
+
+async def _run_in_hash_pool(func, *args):
+    global _hash_pending, _hash_rejected
+    if _hash_pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        _hash_rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        executor = _get_hash_executor()
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # Рабочий процесс умер: пул больше не примет задач, пересоздаём его
+            logger.warning("Password hash pool is broken, recreating it")
+            _discard_hash_executor(executor)
+            return await loop.run_in_executor(_get_hash_executor(), func, *args)
+    finally:
+        _hash_pending -= 1
+
+async def hash_password_in_pool(password: str) -> str:
+    return await _run_in_hash_pool(get_password_hash, password)
+
+async def verify_password_in_pool(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run_in_hash_pool(verify_and_update_password, plain_password, hashed_password)
+
+def hash_pool_stats() -> dict:
+    return {
+        "executor": PASSWORD_HASH_EXECUTOR,
+        "workers": PASSWORD_HASH_WORKERS,
+        "pending": _hash_pending,
+        "rejected": _hash_rejected,
+    }
+
+def shutdown_hash_pool():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True)
+        _hash_executor = None
+
 # Функция для создания JWT токена
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -37,23 +151,63 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Снимок пользователя для кэша: не привязан к сессии SQLAlchemy,
+# поэтому его безопасно отдавать в разные запросы
+@dataclass(frozen=True)
+class CurrentUser:
+    id: int
+    username: str
+    email: str
+    created_at: datetime
+    avatar_path: Optional[str] = None
+
+    @classmethod
+    def from_db(cls, user: UserDB) -> "CurrentUser":
+        return cls(id=user.id, username=user.username, email=user.email,
+                   created_at=user.created_at, avatar_path=user.avatar_path)
+
+# Пользователи по subject токена и уже проверенные токены (до их exp)
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+def decode_token(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        exp = payload.get("exp")
+        if exp is not None:
+            token_cache.set(token, payload, expires_at=float(exp))
+    return payload
+
+# Сбрасывает кэш пользователя, например после смены username, email или аватара
+def invalidate_user(username: str):
+    user_cache.pop(username)
+
+def auth_cache_stats() -> dict:
+    return {"users": user_cache.stats(), "tokens": token_cache.stats()}
+
 # Функция для получения текущего пользователя
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> CurrentUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
+    user: Optional[CurrentUser] = user_cache.get(token_data.username)
+    if user is not None:
+        return user
     result = await db.execute(select(UserDB).where(UserDB.username == token_data.username))
-    user = result.scalar_one_or_none()
-    if user is None:
+    db_user = result.scalar_one_or_none()
+    if db_user is None:
         raise credentials_exception
+    user = CurrentUser.from_db(db_user)
+    user_cache.set(token_data.username, user)
     return user
\ No newline at end of file
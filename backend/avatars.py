@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import UploadFile
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow миниатюры не строятся, отдаётся оригинал
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+AVATAR_DIR = "static/avatars"
+AVATAR_MAX_BYTES = 5 * 1024 * 1024
+AVATAR_CHUNK_BYTES = 64 * 1024
+AVATAR_EXTENSIONS = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+AVATAR_THUMBNAIL_SIZES = (64, 256)
+AVATAR_THUMBNAIL_WORKERS = 2
+
+# Имя файла — sha256 содержимого, поэтому одинаковые картинки хранятся один раз
+AVATAR_NAME_RE = re.compile(r"^([0-9a-f]{64})\.([a-z]+)$")
+
+class AvatarTooLarge(Exception):
+    pass
+
+class UnsupportedAvatarType(Exception):
+    pass
+
+_thumbnail_executor: Optional[ThreadPoolExecutor] = None
+
+# Формат Pillow для каждого типа; по нему проверяется содержимое файла
+_PIL_FORMATS = {"image/jpeg": "JPEG", "image/png": "PNG", "image/gif": "GIF", "image/webp": "WEBP"}
+
+# Проверка по сигнатуре в начале файла, работает и без Pillow
+def _has_signature(head: bytes, media_type: str) -> bool:
+    if media_type == "image/jpeg":
+        return head.startswith(b"\xff\xd8\xff")
+    if media_type == "image/png":
+        return head.startswith(b"\x89PNG\r\n\x1a\n")
+    if media_type == "image/gif":
+        return head.startswith((b"GIF87a", b"GIF89a"))
+    return head[:4] == b"RIFF" and head[8:12] == b"WEBP"
+
+def _is_valid_image(path: str, media_type: str) -> bool:
+    if Image is None:
+        return True
+    try:
+        with Image.open(path) as image:
+            if image.format != _PIL_FORMATS[media_type]:
+                return False
+            image.verify()
+        return True
+    except Exception:
+        return False
+
+def avatar_extension(filename: Optional[str]) -> str:
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    if extension not in AVATAR_EXTENSIONS:
+        raise UnsupportedAvatarType(f"Avatar must be one of: {', '.join(sorted(AVATAR_EXTENSIONS))}")
+    return extension
+
+def avatar_file_path(name: str, size: Optional[int] = None) -> str:
+    if size is None:
+        return os.path.join(AVATAR_DIR, name)
+    digest, extension = name.split(".")
+    return os.path.join(AVATAR_DIR, "thumbs", f"{digest}_{size}.{extension}")
+
+def _store_file(tmp_path: str, final_path: str) -> bool:
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, final_path)
+    return True
+
+# Пишет загрузку на диск кусками, не держа файл целиком в памяти;
+# файловые операции выполняются вне event loop. Возвращает имя файла.
+async def save_avatar(upload: UploadFile) -> str:
+    extension = avatar_extension(upload.filename)
+    await asyncio.to_thread(os.makedirs, AVATAR_DIR, exist_ok=True)
+    tmp = await asyncio.to_thread(tempfile.NamedTemporaryFile, dir=AVATAR_DIR, suffix=".part", delete=False)
+    digest = hashlib.sha256()
+    head = b""
+    size = 0
+    media_type = AVATAR_EXTENSIONS[extension]
+    try:
+        while chunk := await upload.read(AVATAR_CHUNK_BYTES):
+            size += len(chunk)
+            if size > AVATAR_MAX_BYTES:
+                raise AvatarTooLarge(f"Avatar is larger than {AVATAR_MAX_BYTES} bytes")
+            if len(head) < 16:
+                head += chunk[:16]
+            digest.update(chunk)
+            await asyncio.to_thread(tmp.write, chunk)
+        await asyncio.to_thread(tmp.close)
+        # Картинка отдаётся с типом по расширению, поэтому содержимое должно ему соответствовать
+        if not _has_signature(head, media_type) or not await asyncio.to_thread(_is_valid_image, tmp.name, media_type):
+            raise UnsupportedAvatarType(f"Avatar content is not a valid {extension} image")
+    except BaseException:
+        await asyncio.to_thread(tmp.close)
+        await asyncio.to_thread(os.remove, tmp.name)
+        raise
+
+    name = f"{digest.hexdigest()}.{extension}"
+    if await asyncio.to_thread(_store_file, tmp.name, avatar_file_path(name)):
+        schedule_thumbnails(name)
+    return name
+
+def _make_thumbnails(name: str):
+    for size in AVATAR_THUMBNAIL_SIZES:
+        path = avatar_file_path(name, size)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with Image.open(avatar_file_path(name)) as image:
+                image.thumbnail((size, size))
+                tmp_path = f"{path}.part"
+                image.save(tmp_path, format=image.format)
+            os.replace(tmp_path, path)
+        except Exception:
+            logger.exception("Failed to build %spx thumbnail for avatar %s", size, name)
+            return
+
+# Миниатюры строятся в фоновом пуле; пока их нет, отдаётся оригинал
+def schedule_thumbnails(name: str):
+    global _thumbnail_executor
+    if Image is None:
+        return
+    if _thumbnail_executor is None:
+        _thumbnail_executor = ThreadPoolExecutor(max_workers=AVATAR_THUMBNAIL_WORKERS, thread_name_prefix="avatar-thumb")
+    _thumbnail_executor.submit(_make_thumbnails, name)
+
+def shutdown_thumbnail_pool():
+    global _thumbnail_executor
+    if _thumbnail_executor is not None:
+        _thumbnail_executor.shutdown(wait=True)
+        _thumbnail_executor = None
@@ -0,0 +1,106 @@
+import json
+from datetime import datetime, timezone
+from typing import List, Optional
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import dialect_insert
+from models import MoodEntry, MoodEntryBatchItem, MoodBatchItemResult
+from rollups import apply_mood_rollups
+from search import index_mood_entry
+
+MAX_MOOD_BATCH = 1000
+MAX_MOOD_BATCH_BYTES = 4 * 1024 * 1024
+
+class BatchFormatError(ValueError):
+    pass
+
+# Тело запроса: JSON-массив или NDJSON (по объекту на строку)
+def parse_batch_body(body: bytes, content_type: Optional[str]) -> list:
+    try:
+        if content_type and "ndjson" in content_type:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise BatchFormatError(f"Malformed batch body: {exc}")
+    if not isinstance(items, list):
+        raise BatchFormatError("Batch body must be a JSON array or NDJSON stream")
+    return items
+
+# Время клиента приводим к наивному UTC, как и остальные метки в БД
+def _to_utc_naive(timestamp: Optional[datetime]) -> datetime:
+    if timestamp is None:
+        return datetime.utcnow()
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+# Вставляет пачку записей одним INSERT ... ON CONFLICT DO NOTHING RETURNING.
+# Повторы по (user_id, client_key) не вставляются и помечаются как duplicate.
+async def insert_mood_batch(db: AsyncSession, user_id: int, raw_items: list) -> List[MoodBatchItemResult]:
+    results: List[Optional[MoodBatchItemResult]] = [None] * len(raw_items)
+    rows = []
+    first_index = {}  # client_key -> индекс первого вхождения в пачке
+    for index, raw in enumerate(raw_items):
+        try:
+            item = MoodEntryBatchItem.model_validate(raw)
+        except ValidationError as exc:
+            error = exc.errors()[0]
+            location = ".".join(str(part) for part in error["loc"])
+            results[index] = MoodBatchItemResult(
+                index=index, status="invalid", error=f"{location}: {error['msg']}" if location else error["msg"],
+            )
+            continue
+        if item.client_key in first_index:
+            results[index] = MoodBatchItemResult(index=index, status="duplicate", client_key=item.client_key)
+            continue
+        first_index[item.client_key] = index
+        rows.append({
+            "user_id": user_id,
+            "mood": item.mood,
+            "details": item.details,
+            "timestamp": _to_utc_naive(item.timestamp),
+            "client_key": item.client_key,
+        })
+
+    stored = {}  # client_key -> (id, timestamp)
+    if rows:
+        insert = dialect_insert(db)
+        stmt = (
+            insert(MoodEntry)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["user_id", "client_key"])
+            .returning(MoodEntry.id, MoodEntry.client_key, MoodEntry.timestamp, MoodEntry.mood, MoodEntry.details)
+        )
+        created = (await db.execute(stmt)).all()
+        for entry_id, client_key, timestamp, _, _ in created:
+            stored[client_key] = (entry_id, timestamp)
+            results[first_index[client_key]] = MoodBatchItemResult(
+                index=first_index[client_key], status="created",
+                client_key=client_key, id=entry_id, timestamp=timestamp,
+            )
+        await apply_mood_rollups(db, user_id, [(mood, timestamp) for _, _, timestamp, mood, _ in created])
+
+        # Ключи, которые уже были в БД после прошлой синхронизации
+        replayed = [row["client_key"] for row in rows if row["client_key"] not in stored]
+        if replayed:
+            existing = await db.execute(
+                select(MoodEntry.id, MoodEntry.client_key, MoodEntry.timestamp)
+                .where(MoodEntry.user_id == user_id, MoodEntry.client_key.in_(replayed))
+            )
+            for entry_id, client_key, timestamp in existing:
+                stored[client_key] = (entry_id, timestamp)
+                results[first_index[client_key]] = MoodBatchItemResult(
+                    index=first_index[client_key], status="duplicate",
+                    client_key=client_key, id=entry_id, timestamp=timestamp,
+                )
+        await db.commit()
+        for entry_id, _, timestamp, _, details in created:
+            index_mood_entry(user_id, entry_id, timestamp, details)
+
+    # Повторы внутри одной пачки ссылаются на ту же запись
+    for result in results:
+        if result.status == "duplicate" and result.id is None and result.client_key in stored:
+            result.id, result.timestamp = stored[result.client_key]
+    return results
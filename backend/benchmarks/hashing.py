@@ -0,0 +1,77 @@
+# Задержка event loop во время всплеска входов: хэширование прямо в loop
+# против хэширования в пуле. Запуск из каталога backend:
+#   python benchmarks/hashing.py --logins 50
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from stats import percentile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth  # noqa: E402
+
+
+# Тикер раз в миллисекунду: насколько позже срока он просыпается
+async def measure_loop_lag(stop: asyncio.Event, lags: list):
+    interval = 0.001
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - expected) * 1000)
+
+
+async def run(mode: str, logins: int, hashed: str) -> dict:
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(measure_loop_lag(stop, lags))
+
+    async def login_inline():
+        auth.verify_password("password", hashed)
+        await asyncio.sleep(0)
+
+    async def login_pooled():
+        await auth.verify_password_in_pool("password", hashed)
+
+    login = login_inline if mode == "inline" else login_pooled
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    lags.sort()
+    return {
+        "logins": logins,
+        "elapsed_s": round(elapsed, 4),
+        "logins_per_s": round(logins / elapsed, 1),
+        "loop_lag_ms": {
+            "p50": round(percentile(lags, 50), 3),
+            "p99": round(percentile(lags, 99), 3),
+            "max": round(lags[-1], 3),
+        },
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=50)
+    args = parser.parse_args()
+
+    hashed = auth.get_password_hash("password")
+    # прогрев пула, чтобы не мерить запуск процессов
+    await asyncio.gather(*(auth.verify_password_in_pool("password", hashed) for _ in range(auth.PASSWORD_HASH_WORKERS)))
+    report = {
+        "executor": auth.PASSWORD_HASH_EXECUTOR,
+        "workers": auth.PASSWORD_HASH_WORKERS,
+        "inline": await run("inline", args.logins, hashed),
+        "pool": await run("pool", min(args.logins, auth.PASSWORD_HASH_WORKERS + auth.PASSWORD_HASH_MAX_QUEUE), hashed),
+    }
+    auth.shutdown_hash_pool()
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+# История и выгрузка настроений для «тяжёлого» пользователя.
+# База — временный SQLite-файл, запуск из каталога backend:
+#   python benchmarks/history.py --entries 1000000
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from models import Base, MoodEntry, UserDB  # noqa: E402
+from history import list_mood_page, stream_mood_export  # noqa: E402
+
+MOODS = ("great", "good", "ok", "bad", "awful")
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def seed(engine, entries: int) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        user_id = (await conn.execute(
+            insert(UserDB).values(username="heavy", email="heavy@example.com", hashed_password="x").returning(UserDB.id)
+        )).scalar_one()
+    start = datetime(2020, 1, 1)
+    chunk = 50000
+    for offset in range(0, entries, chunk):
+        rows = [
+            {"user_id": user_id, "mood": MOODS[i % len(MOODS)], "details": f"note {i}",
+             "timestamp": start + timedelta(minutes=i)}
+            for i in range(offset, min(entries, offset + chunk))
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(insert(MoodEntry), rows)
+    return user_id
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--naive", action="store_true", help="для сравнения загрузить всю историю через .all()")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/bench.db")
+        session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        started = time.perf_counter()
+        user_id = await seed(engine, args.entries)
+        report = {"entries": args.entries, "seed_s": round(time.perf_counter() - started, 2)}
+
+        # Листание истории курсором: время страницы не зависит от глубины
+        page_ms = []
+        cursor = None
+        async with session_factory() as db:
+            for _ in range(args.pages):
+                started = time.perf_counter()
+                _, cursor = await list_mood_page(db, user_id, cursor, 50)
+                page_ms.append((time.perf_counter() - started) * 1000)
+        page_ms.sort()
+        report["page_ms"] = {
+            "first": round(page_ms[0], 3),
+            "p50": round(page_ms[len(page_ms) // 2], 3),
+            "max": round(page_ms[-1], 3),
+        }
+
+        for fmt in ("csv", "ndjson"):
+            rss_before = max_rss_mb()
+            started = time.perf_counter()
+            size = 0
+            async for chunk in stream_mood_export(user_id, fmt, session_factory=session_factory):
+                size += len(chunk)
+            elapsed = time.perf_counter() - started
+            report[f"export_{fmt}"] = {
+                "seconds": round(elapsed, 2),
+                "rows_per_s": round(args.entries / elapsed),
+                "megabytes": round(size / 2**20, 1),
+                "max_rss_growth_mb": round(max_rss_mb() - rss_before, 1),
+            }
+
+        if args.naive:
+            rss_before = max_rss_mb()
+            started = time.perf_counter()
+            async with session_factory() as db:
+                rows = (await db.execute(select(MoodEntry).where(MoodEntry.user_id == user_id))).scalars().all()
+            report["naive_all"] = {
+                "seconds": round(time.perf_counter() - started, 2),
+                "rows": len(rows),
+                "max_rss_growth_mb": round(max_rss_mb() - rss_before, 1),
+            }
+        await engine.dispose()
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
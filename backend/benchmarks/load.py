@@ -0,0 +1,181 @@
+# Нагрузочный бенчмарк API: приложение поднимается в этом же процессе
+# поверх временной SQLite-базы (или базы из DATABASE_URL), клиенты ходят
+# в него через ASGI-транспорт httpx. Запуск из каталога backend:
+#   python benchmarks/load.py --users 50 --clients 20 --requests 2000 --out before.json
+#   python benchmarks/load.py ... --compare before.json
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from stats import percentile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmpdir.name}/bench.db")
+os.environ.setdefault("DB_ECHO", "false")
+
+import httpx  # noqa: E402
+import main  # noqa: E402
+from database import engine  # noqa: E402
+
+# логи каждого запроса сами по себе искажают замеры
+logging.getLogger().setLevel(logging.ERROR)
+
+MOODS = ("great", "good", "ok", "bad", "awful")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def call(self, endpoint: str, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        self.latencies.setdefault(endpoint, []).append((time.perf_counter() - started) * 1000)
+        if failed:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        result = {}
+        for endpoint, values in self.latencies.items():
+            ordered = sorted(values)
+            result[endpoint] = {
+                "requests": len(ordered),
+                "errors": self.errors.get(endpoint, 0),
+                "rps": round(len(ordered) / elapsed, 1),
+                "p50_ms": round(percentile(ordered, 50), 3),
+                "p95_ms": round(percentile(ordered, 95), 3),
+                "p99_ms": round(percentile(ordered, 99), 3),
+                "max_ms": round(ordered[-1], 3),
+            }
+        return result
+
+
+# Выполняет jobs (фабрики корутин) не более чем в clients параллельных клиентах
+async def run_phase(jobs, clients: int) -> float:
+    queue = list(reversed(jobs))
+
+    async def client():
+        while queue:
+            await queue.pop()()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - started
+
+
+async def bench(args) -> dict:
+    await main.startup()
+    phases = {}
+    prefix = uuid.uuid4().hex[:8]
+    users = [(f"{prefix}_{i}", f"{prefix}_{i}@example.com") for i in range(args.users)]
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        recorder = Recorder()
+        elapsed = await run_phase([
+            (lambda u=u: recorder.call("POST /register", http.post(
+                "/register", json={"username": u[0], "email": u[1], "password": "password"})))
+            for u in users
+        ], args.clients)
+        phases["register"] = recorder.report(elapsed)
+
+        tokens = []
+
+        async def login(username):
+            response = await http.post("/token", data={"username": username, "password": "password"})
+            if response.status_code == 200:
+                tokens.append(response.json()["access_token"])
+            return response
+
+        recorder = Recorder()
+        elapsed = await run_phase([
+            (lambda u=u: recorder.call("POST /token", login(u[0]))) for u in users
+        ], args.clients)
+        phases["token"] = recorder.report(elapsed)
+        if not tokens:
+            raise RuntimeError("No user could log in, nothing to benchmark")
+        headers = [{"Authorization": f"Bearer {token}"} for token in tokens]
+
+        recorder = Recorder()
+        elapsed = await run_phase([
+            (lambda i=i: recorder.call("GET /me", http.get("/me", headers=headers[i % len(headers)])))
+            for i in range(args.requests)
+        ], args.clients)
+        phases["me"] = recorder.report(elapsed)
+
+        recorder = Recorder()
+        elapsed = await run_phase([
+            (lambda i=i: recorder.call("POST /mood", http.post(
+                "/mood", json={"mood": MOODS[i % len(MOODS)]}, headers=headers[i % len(headers)])))
+            for i in range(args.requests)
+        ], args.clients)
+        phases["mood"] = recorder.report(elapsed)
+
+        # Запись настроения на фоне всплеска входов: /mood не должен ждать хэширования
+        recorder = Recorder()
+        jobs = []
+        for i in range(args.requests):
+            jobs.append(lambda i=i: recorder.call("POST /mood", http.post(
+                "/mood", json={"mood": MOODS[i % len(MOODS)]}, headers=headers[i % len(headers)])))
+            if i % 10 == 0:
+                jobs.append(lambda i=i: recorder.call("POST /token", login(users[i % len(users)][0])))
+        elapsed = await run_phase(jobs, args.clients)
+        phases["mood_under_login_load"] = recorder.report(elapsed)
+
+    await main.shutdown()
+    return {
+        "config": {
+            "users": args.users,
+            "clients": args.clients,
+            "requests": args.requests,
+            "database": engine.dialect.name,
+        },
+        "phases": phases,
+    }
+
+
+def compare(current: dict, baseline: dict):
+    for phase, endpoints in current["phases"].items():
+        for endpoint, stats in endpoints.items():
+            before = baseline.get("phases", {}).get(phase, {}).get(endpoint)
+            if not before:
+                continue
+            print(f"{phase:24} {endpoint:16} rps {before['rps']:>9} -> {stats['rps']:<9} "
+                  f"p99 {before['p99_ms']:>9} -> {stats['p99_ms']} ms", file=sys.stderr)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--out", help="записать JSON-отчёт в файл")
+    parser.add_argument("--compare", help="JSON-отчёт предыдущего прогона для сравнения")
+    args = parser.parse_args()
+
+    report = asyncio.run(bench(args))
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,59 @@
+# POST /mood: коммит на каждый запрос против групповой записи (write-behind).
+# Окружение то же, что у load.py. Запуск из каталога backend:
+#   python benchmarks/mood_writes.py --clients 50 --requests 5000
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load import MOODS, Recorder, run_phase  # noqa: E402
+import httpx  # noqa: E402
+import main  # noqa: E402
+import writebehind  # noqa: E402
+
+
+async def bench(args) -> dict:
+    await main.startup()
+    report = {"config": {"clients": args.clients, "requests": args.requests,
+                         "flush_interval_ms": writebehind.MOOD_FLUSH_INTERVAL_MS,
+                         "flush_max_batch": writebehind.MOOD_FLUSH_MAX_BATCH}}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as http:
+        headers = []
+        for i in range(args.users):
+            username = f"writer_{i}"
+            await http.post("/register", json={"username": username, "email": f"{username}@example.com", "password": "password"})
+            token = (await http.post("/token", data={"username": username, "password": "password"})).json()["access_token"]
+            headers.append({"Authorization": f"Bearer {token}"})
+
+        async def phase():
+            recorder = Recorder()
+            elapsed = await run_phase([
+                (lambda i=i: recorder.call("POST /mood", http.post(
+                    "/mood", json={"mood": MOODS[i % len(MOODS)]}, headers=headers[i % len(headers)])))
+                for i in range(args.requests)
+            ], args.clients)
+            return recorder.report(elapsed)["POST /mood"]
+
+        report["per_request_commit"] = await phase()
+        writebehind.MOOD_WRITE_BEHIND = True
+        writebehind.start_write_behind()
+        report["write_behind"] = await phase()
+        report["write_behind"]["flushes"] = writebehind.buffer.flushes
+    await main.shutdown()
+    return report
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(bench(args)), indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,87 @@
+# Планировщик напоминаний на миллионе пользователей: память на расписания,
+# пропускная способность и опоздание срабатываний. Без БД: раз в N-й
+# пользователь «уже отметился сегодня». Запуск из каталога backend:
+#   python benchmarks/reminders.py --users 1000000 --spread 20
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from stats import percentile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reminders import ReminderEngine  # noqa: E402
+
+
+class CountingSink:
+    def __init__(self):
+        self.count = 0
+        self.lags = []
+
+    async def send(self, reminders):
+        self.count += len(reminders)
+        self.lags.extend(reminder.fired_at - reminder.due_at for reminder in reminders)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--spread", type=int, default=20, help="срабатывания равномерно в ближайшие N секунд; 0 — все сразу")
+    parser.add_argument("--skip-every", type=int, default=10)
+    args = parser.parse_args()
+
+    sink = CountingSink()
+
+    async def skip_filter(reminders, schedules):
+        return {reminder.user_id: schedules[reminder.user_id] for reminder in reminders
+                if reminder.user_id % args.skip_every == 0}
+
+    # Виртуальные часы: загрузка под tracemalloc долгая, поэтому время
+    # «запускаем» только после неё, и первые срабатывания наступают через секунду
+    base = 10**9
+    shift = 0.0
+    engine = ReminderEngine(sink, skip_filter=skip_filter, clock=lambda: time.time() - shift)
+    rng = random.Random(42)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for user_id in range(1, args.users + 1):
+        engine.schedule(user_id, rng.randrange(1440), rng.randrange(-720, 841, 30), due=base + rng.randrange(args.spread + 1))
+    load_s = time.perf_counter() - started
+    memory_mb = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+
+    shift = time.time() - (base - 1)
+    engine.start()
+    while engine.fired + engine.skipped < args.users:
+        await asyncio.sleep(0.01)
+    elapsed = time.time() - shift - base
+    await engine.stop()
+
+    lags = sorted(sink.lags)
+    print(json.dumps({
+        "users": args.users,
+        "schedule_load_s": round(load_s, 2),
+        "schedule_memory_mb": round(memory_mb, 1),
+        "memory_bytes_per_user": round(memory_mb * 2**20 / args.users),
+        "fired": engine.fired,
+        "skipped": engine.skipped,
+        "batches": engine.batches,
+        "elapsed_after_first_due_s": round(elapsed, 3),
+        "dispatch_per_s": round(args.users / max(elapsed, args.spread)),
+        "lag_s": {
+            "p50": round(percentile(lags, 50), 3),
+            "p99": round(percentile(lags, 99), 3),
+            "max": round(lags[-1], 3),
+        },
+        "still_scheduled": len(engine),
+    }, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,7 @@
+# Общие помощники для бенчмарков: без импорта приложения и БД,
+# чтобы их можно было подключать из любого сценария
+
+
+# Перцентиль q (0–100) по уже отсортированному списку, ближайший ранг
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
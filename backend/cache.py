@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Ограниченный in-process кэш с TTL и вытеснением по LRU.
+# Рассчитан на один event loop, поэтому обходится без блокировок.
+# sliding=True продлевает TTL при каждом попадании: запись живёт, пока ей пользуются.
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, sliding: bool = False):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sliding = sliding
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        value, expires_at = item
+        now = time.time()
+        if expires_at <= now:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        if self.sliding:
+            self._data[key] = (value, now + self.ttl)
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    # expires_at (unix time) позволяет ограничить жизнь записи сильнее, чем ttl
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None):
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        self._data[key] = (value, deadline)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
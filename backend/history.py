@@ -0,0 +1,75 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import MoodEntry
+
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_COLUMNS = ("id", "timestamp", "mood", "details")
+
+class InvalidCursor(ValueError):
+    pass
+
+# Курсор — позиция последней выданной записи (timestamp, id) в base64
+def encode_cursor(timestamp: datetime, entry_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{entry_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, entry_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(entry_id)
+    except ValueError:
+        raise InvalidCursor("Invalid cursor")
+
+# Страница истории от новых записей к старым. Keyset по (timestamp, id):
+# стоимость не растёт с глубиной, в отличие от OFFSET
+async def list_mood_page(db: AsyncSession, user_id: int, cursor: Optional[str], limit: int) -> Tuple[List[MoodEntry], Optional[str]]:
+    query = select(MoodEntry).where(MoodEntry.user_id == user_id)
+    if cursor:
+        timestamp, entry_id = decode_cursor(cursor)
+        query = query.where(or_(
+            MoodEntry.timestamp < timestamp,
+            and_(MoodEntry.timestamp == timestamp, MoodEntry.id < entry_id),
+        ))
+    query = query.order_by(MoodEntry.timestamp.desc(), MoodEntry.id.desc()).limit(limit + 1)
+    entries = list((await db.execute(query)).scalars())
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1].timestamp, entries[-1].id)
+    return entries, next_cursor
+
+def _format_chunk(rows, fmt: str) -> str:
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps({"id": entry_id, "timestamp": timestamp.isoformat(), "mood": mood, "details": details},
+                       ensure_ascii=False) + "\n"
+            for entry_id, timestamp, mood, details in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows((entry_id, timestamp.isoformat(), mood, details) for entry_id, timestamp, mood, details in rows)
+    return buffer.getvalue()
+
+# Потоковая выгрузка всей истории через серверный курсор: в памяти
+# держится не больше EXPORT_CHUNK_ROWS строк, сколько бы записей ни было.
+# Сессия своя, потому что генератор живёт дольше зависимости get_db.
+async def stream_mood_export(user_id: int, fmt: str, session_factory=AsyncSessionLocal) -> AsyncIterator[str]:
+    if fmt == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\r\n"
+    async with session_factory() as session:
+        result = await session.stream(
+            select(MoodEntry.id, MoodEntry.timestamp, MoodEntry.mood, MoodEntry.details)
+            .where(MoodEntry.user_id == user_id)
+            .order_by(MoodEntry.timestamp, MoodEntry.id)
+            .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+        )
+        async for rows in result.partitions():
+            yield _format_chunk(rows, fmt)
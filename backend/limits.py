@@ -0,0 +1,35 @@
+from typing import Dict, Tuple
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# Ограничивает размер тела запроса для выбранных маршрутов до того, как его
+# прочитает обработчик или разбор multipart: слишком большой Content-Length
+# отклоняется сразу, а тело без него считается по мере получения
+class BodySizeLimitMiddleware:
+    def __init__(self, app, limits: Dict[Tuple[str, str], int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        detail = f"Request body is larger than {limit} bytes"
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                response = JSONResponse({"detail": detail}, status_code=413)
+                return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
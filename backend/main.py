@@ -1,17 +1,45 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, Request, Response
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import update, select  # Import select here
-from database import get_db, create_tables
-from models import UserCreate, User, Token, UserDB, MoodEntry, MoodEntryCreate, MoodEntryOut
-from auth import get_password_hash, create_access_token, verify_password, get_current_user
-from datetime import timedelta
-from typing import Optional
+from database import engine, get_db, create_tables
+from models import (
+    UserCreate, User, Token, UserDB, MoodEntry, MoodEntryCreate, MoodEntryOut,
+    MoodSummaryOut, MoodBatchOut, MoodHistoryPage, MoodSearchPage, ReminderIn, ReminderOut, ReminderSchedule,
+)
+from auth import (
+    hash_password_in_pool, verify_password_in_pool, create_access_token, get_current_user,
+    CurrentUser, invalidate_user, auth_cache_stats, hash_pool_stats, shutdown_hash_pool,
+)
+from rollups import apply_mood_rollups, backfill_mood_rollups, summarize_moods
+from batch import MAX_MOOD_BATCH, MAX_MOOD_BATCH_BYTES, BatchFormatError, parse_batch_body, insert_mood_batch
+from history import InvalidCursor, list_mood_page, stream_mood_export
+from search import InvalidSearchCursor, create_search_index, index_mood_entry, search_mood_entries
+from avatars import (
+    AVATAR_EXTENSIONS, AVATAR_MAX_BYTES, AVATAR_NAME_RE, AVATAR_THUMBNAIL_SIZES, AvatarTooLarge, UnsupportedAvatarType,
+    avatar_file_path, save_avatar, shutdown_thumbnail_pool,
+)
+from metrics import MetricsMiddleware, instrument_engine, render_metrics
+from limits import BodySizeLimitMiddleware
+import reminders
+import writebehind
+import os
+from datetime import date, datetime, timedelta
+from typing import Literal, Optional
 import logging
+import time
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
 
+# Лимиты размера тела: проверяются до чтения тела в обработчике
+app.add_middleware(BodySizeLimitMiddleware, limits={
+    ("POST", "/mood/batch"): MAX_MOOD_BATCH_BYTES,
+    # аватар плюс запас на заголовки multipart
+    ("PUT", "/users/me/update"): AVATAR_MAX_BYTES + 64 * 1024,
+})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -27,6 +55,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики задержек и запросов к БД по маршрутам, см. /metrics
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+
 # Настройка логов
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,6 +67,17 @@ logger = logging.getLogger(__name__)
 @app.on_event("startup")
 async def startup():
     await create_tables()
+    await backfill_mood_rollups()
+    await create_search_index()
+    await reminders.start_reminders()
+    writebehind.start_write_behind()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await writebehind.stop_write_behind()
+    await reminders.stop_reminders()
+    shutdown_hash_pool()
+    shutdown_thumbnail_pool()
 
 # Регистрация пользователя
 @app.post("/register", response_model=User)
@@ -45,7 +88,7 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     if db_user:
         logger.warning("Email already registered: %s", user.email)
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password_in_pool(user.password)
     logger.info("Password hashed successfully")
     db_user = UserDB(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(db_user)
@@ -69,12 +112,18 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
         )
     
     # Проверяем пароль
-    if not verify_password(form_data.password, user.hashed_password):
+    password_ok, new_hash = await verify_password_in_pool(form_data.password, user.hashed_password)
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Схема или rounds поменялись — сохраняем пароль с новыми настройками
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     
     # Создаём токен
     access_token_expires = timedelta(minutes=60)
@@ -86,13 +135,13 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
 
 # Защищённый эндпоинт
 @app.get("/users/me", response_model=User)
-async def read_users_me(current_user: UserDB = Depends(get_current_user)):
+async def read_users_me(current_user: CurrentUser = Depends(get_current_user)):
     return current_user
 
 # Обновление информации пользователя
 @app.put("/users/me/update")
 async def update_user_info(
-    current_user: UserDB = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     username: Optional[str] = None,
     email: Optional[str] = None,
     avatar: Optional[UploadFile] = File(None),
@@ -105,34 +154,227 @@ async def update_user_info(
         update_data["email"] = email
     if avatar:
         # Сохраняем файл на сервере и обновляем путь к аватару в базе данных
-        avatar_path = f"static/avatars/{current_user.id}_{avatar.filename}"
-        with open(avatar_path, "wb") as buffer:
-            buffer.write(await avatar.read())
-        update_data["avatar_path"] = avatar_path
+        try:
+            avatar_name = await save_avatar(avatar)
+        except AvatarTooLarge as exc:
+            raise HTTPException(status_code=413, detail=str(exc))
+        except UnsupportedAvatarType as exc:
+            raise HTTPException(status_code=415, detail=str(exc))
+        update_data["avatar_path"] = f"/avatars/{avatar_name}"
 
     if update_data:
         await db.execute(update(UserDB).where(UserDB.id == current_user.id).values(**update_data))  
         await db.commit()
+        invalidate_user(current_user.username)
 
     return {"message": "User information updated successfully"}
 
+# Раздача аватаров. Файлы неизменяемы (имя — хэш содержимого),
+# поэтому кэшируются надолго, а повторный запрос с ETag получает 304
+@app.get("/avatars/{name}")
+async def read_avatar(name: str, request: Request, size: Optional[int] = None):
+    match = AVATAR_NAME_RE.match(name)
+    if not match or match.group(2) not in AVATAR_EXTENSIONS:
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    if size is not None and size not in AVATAR_THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(AVATAR_THUMBNAIL_SIZES)}")
+
+    path = avatar_file_path(name, size)
+    cache_control = "public, max-age=31536000, immutable"
+    if size is not None and not os.path.exists(path):
+        # миниатюра ещё не готова: отдаём оригинал, но ненадолго
+        size, path = None, avatar_file_path(name)
+        cache_control = "public, max-age=60"
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    etag = f'"{match.group(1)}-{size or "orig"}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=AVATAR_EXTENSIONS[match.group(2)], headers=headers)
+
 #эндпоинт для оценки настроения
 @app.post("/mood", response_model=MoodEntryOut)
 async def create_mood_entry(
     mood_entry: MoodEntryCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: UserDB = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
+    # Групповая запись: строку вставит фоновая задача вместе с соседними запросами
+    buffer = writebehind.buffer
+    if buffer is not None and buffer.accepting:
+        # Отдаём соединение в пул, пока ждём сброса, иначе флашеру может его не хватить
+        await db.close()
+        return await buffer.submit(current_user.id, mood_entry.mood, mood_entry.details)
+
     new_entry = MoodEntry(
         user_id=current_user.id,
         mood=mood_entry.mood,
-        details=mood_entry.details
+        details=mood_entry.details,
+        timestamp=datetime.utcnow()
     )
     db.add(new_entry)
+    # Дневной агрегат обновляется в той же транзакции, что и сама запись
+    await apply_mood_rollups(db, current_user.id, [(new_entry.mood, new_entry.timestamp)])
     await db.commit()
     await db.refresh(new_entry)
+    index_mood_entry(current_user.id, new_entry.id, new_entry.timestamp, new_entry.details)
     return new_entry
 
+# История настроений постранично, от новых к старым
+@app.get("/mood", response_model=MoodHistoryPage)
+async def list_mood_entries(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    try:
+        items, next_cursor = await list_mood_page(db, current_user.id, cursor, limit)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"items": items, "next_cursor": next_cursor}
+
+# Поиск по текстовым заметкам с фильтром по датам
+@app.get("/mood/search", response_model=MoodSearchPage)
+async def search_mood(
+    q: str = Query(..., min_length=1, max_length=200),
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    try:
+        hits, next_cursor = await search_mood_entries(db, current_user.id, q, start, end, cursor, limit)
+    except InvalidSearchCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    items = [
+        {"id": entry.id, "mood": entry.mood, "details": entry.details, "timestamp": entry.timestamp, "rank": rank}
+        for entry, rank in hits
+    ]
+    return {"items": items, "next_cursor": next_cursor}
+
+# Выгрузка всей истории (например, для психолога) потоком CSV или NDJSON
+@app.get("/mood/export")
+async def export_mood_entries(
+    format: Literal["csv", "ndjson"] = "csv",
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_mood_export(current_user.id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="mood.{format}"'},
+    )
+
+# Пакетная загрузка записей, накопленных офлайн (JSON-массив или NDJSON)
+@app.post("/mood/batch", response_model=MoodBatchOut)
+async def create_mood_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    try:
+        items = parse_batch_body(await request.body(), request.headers.get("content-type"))
+    except BatchFormatError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if len(items) > MAX_MOOD_BATCH:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {MAX_MOOD_BATCH} entries")
+    results = await insert_mood_batch(db, current_user.id, items)
+    return {
+        "created": sum(result.status == "created" for result in results),
+        "duplicates": sum(result.status == "duplicate" for result in results),
+        "invalid": sum(result.status == "invalid" for result in results),
+        "results": results,
+    }
+
+# Диаграмма настроений за период: читает дневные агрегаты, а не сырые записи
+@app.get("/mood/summary", response_model=MoodSummaryOut)
+async def mood_summary(
+    response: Response,
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    bucket: Literal["day", "week", "month"] = "day",
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    started = time.perf_counter()
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=30)
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    buckets = await summarize_moods(db, current_user.id, start, end, bucket)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    response.headers["Server-Timing"] = f"summary;dur={elapsed_ms:.3f}"
+    logger.debug("Mood summary for user %s took %.3f ms", current_user.id, elapsed_ms)
+    return {"bucket": bucket, "start": start, "end": end, "buckets": buckets}
+
 @app.get("/me", response_model=User)
-async def read_users_me(current_user: UserDB = Depends(get_current_user)):
+async def read_users_me(current_user: CurrentUser = Depends(get_current_user)):
     return current_user
+
+# Расписание напоминаний текущего пользователя
+@app.get("/reminders/me", response_model=ReminderOut)
+async def read_reminder(
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    schedule = await db.get(ReminderSchedule, current_user.id)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="Reminder is not set")
+    return ReminderOut(hour=schedule.minute_of_day // 60, minute=schedule.minute_of_day % 60,
+                       utc_offset_minutes=schedule.utc_offset_minutes, enabled=schedule.enabled)
+
+@app.put("/reminders/me", response_model=ReminderOut)
+async def set_reminder(
+    reminder: ReminderIn,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    schedule = await db.get(ReminderSchedule, current_user.id)
+    if schedule is None:
+        schedule = ReminderSchedule(user_id=current_user.id)
+        db.add(schedule)
+    schedule.minute_of_day = reminder.hour * 60 + reminder.minute
+    schedule.utc_offset_minutes = reminder.utc_offset_minutes
+    schedule.enabled = reminder.enabled
+    await db.commit()
+    reminders.apply_reminder_schedule(schedule)
+    return reminder
+
+@app.delete("/reminders/me")
+async def delete_reminder(
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    schedule = await db.get(ReminderSchedule, current_user.id)
+    if schedule is not None:
+        await db.delete(schedule)
+        await db.commit()
+    reminders.remove_reminder_schedule(current_user.id)
+    return {"message": "Reminder removed"}
+
+# Счётчики кэша пользователей и токенов: сколько запросов к БД сэкономлено
+@app.get("/auth/cache-stats")
+async def read_auth_cache_stats():
+    return auth_cache_stats()
+
+# Метрики в формате Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    extra = {}
+    for cache_name, stats in auth_cache_stats().items():
+        for key in ("size", "hits", "misses", "evictions", "expirations"):
+            extra[f'auth_cache_{key}{{cache="{cache_name}"}}'] = stats[key]
+    if reminders.scheduler is not None:
+        for key, value in reminders.scheduler.stats().items():
+            extra[f"reminders_{key}"] = value
+    if writebehind.buffer is not None:
+        for key, value in writebehind.buffer.stats().items():
+            extra[f"mood_write_behind_{key}"] = value
+    hash_stats = hash_pool_stats()
+    extra["password_hash_pending"] = hash_stats["pending"]
+    extra["password_hash_rejected_total"] = hash_stats["rejected"]
+    return PlainTextResponse(render_metrics(extra), media_type="text/plain; version=0.0.4")
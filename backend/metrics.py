@@ -0,0 +1,155 @@
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Запросы к БД дольше этого порога пишутся в лог
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+# Верхние границы корзин гистограммы задержек, мс (последняя — +Inf)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Счётчики одного маршрута; создаются один раз при первом запросе к нему
+class RouteStats:
+    __slots__ = ("buckets", "count", "latency_ms_sum", "errors", "db_queries", "db_time_ms")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.latency_ms_sum = 0.0
+        self.errors = 0
+        self.db_queries = 0
+        self.db_time_ms = 0.0
+
+routes: Dict[str, RouteStats] = {}
+in_flight = 0
+db_queries_total = 0
+db_time_ms_total = 0.0
+slow_queries_total = 0
+query_errors_total = 0
+
+# [число запросов к БД, время в БД, мс] текущего HTTP-запроса
+_request_db: ContextVar[Optional[List]] = ContextVar("request_db", default=None)
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+# ASGI-middleware: задержка, ошибки и время в БД по каждому маршруту
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        global in_flight
+        in_flight += 1
+        db_usage = [0, 0.0]
+        token = _request_db.set(db_usage)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            in_flight -= 1
+            _request_db.reset(token)
+            label = f'{scope["method"]} {_route_label(scope)}'
+            stats = routes.get(label)
+            if stats is None:
+                stats = routes[label] = RouteStats()
+            stats.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+            stats.count += 1
+            stats.latency_ms_sum += elapsed_ms
+            stats.db_queries += db_usage[0]
+            stats.db_time_ms += db_usage[1]
+            if status_code >= 500:
+                stats.errors += 1
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_query(conn.info["query_started"].pop(), statement)
+
+# Упавший запрос: after_cursor_execute для него не вызывается, поэтому
+# время начала снимается здесь, иначе оно останется в conn.info
+def _handle_error(exception_context):
+    global query_errors_total
+    query_errors_total += 1
+    conn = exception_context.connection
+    started = conn.info.get("query_started") if conn is not None else None
+    if started:
+        _record_query(started.pop(), exception_context.statement)
+
+def _record_query(started: float, statement: Optional[str]):
+    global db_queries_total, db_time_ms_total, slow_queries_total
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    db_queries_total += 1
+    db_time_ms_total += elapsed_ms
+    db_usage = _request_db.get()
+    if db_usage is not None:
+        db_usage[0] += 1
+        db_usage[1] += elapsed_ms
+    if elapsed_ms >= SLOW_QUERY_MS:
+        slow_queries_total += 1
+        logger.warning("Slow query (%.1f ms): %s", elapsed_ms, statement)
+
+# Подписывается на события движка, чтобы считать запросы к БД
+def instrument_engine(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+# Текст в формате Prometheus; extra — дополнительные значения вида {имя: число}
+def render_metrics(extra: Optional[Dict[str, float]] = None) -> str:
+    lines = [
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {in_flight}",
+        "# TYPE http_request_duration_ms histogram",
+    ]
+    for label, stats in routes.items():
+        route = f'route="{_escape(label)}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, stats.buckets):
+            cumulative += count
+            lines.append(f'http_request_duration_ms_bucket{{{route},le="{bound}"}} {cumulative}')
+        lines.append(f'http_request_duration_ms_bucket{{{route},le="+Inf"}} {stats.count}')
+        lines.append(f"http_request_duration_ms_sum{{{route}}} {stats.latency_ms_sum:.3f}")
+        lines.append(f"http_request_duration_ms_count{{{route}}} {stats.count}")
+    lines.append("# TYPE http_request_errors_total counter")
+    lines.extend(f'http_request_errors_total{{route="{_escape(label)}"}} {stats.errors}' for label, stats in routes.items())
+    lines.append("# TYPE http_request_db_queries_total counter")
+    lines.extend(f'http_request_db_queries_total{{route="{_escape(label)}"}} {stats.db_queries}' for label, stats in routes.items())
+    lines.append("# TYPE http_request_db_time_ms_total counter")
+    lines.extend(f'http_request_db_time_ms_total{{route="{_escape(label)}"}} {stats.db_time_ms:.3f}' for label, stats in routes.items())
+    lines += [
+        "# TYPE db_queries_total counter",
+        f"db_queries_total {db_queries_total}",
+        "# TYPE db_time_ms_total counter",
+        f"db_time_ms_total {db_time_ms_total:.3f}",
+        "# TYPE db_slow_queries_total counter",
+        f"db_slow_queries_total {slow_queries_total}",
+        "# TYPE db_query_errors_total counter",
+        f"db_query_errors_total {query_errors_total}",
+    ]
+    for name, value in (extra or {}).items():
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
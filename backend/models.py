@@ -1,7 +1,7 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
-from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, Dict, List
+from datetime import datetime, date
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -20,6 +20,7 @@ class UserCreate(UserBase):
 class User(UserBase):
     id: int
     created_at: datetime
+    avatar_path: Optional[str] = None
 
     class Config:
         from_attributes = True  # Замените orm_mode на from_attributes
@@ -42,6 +43,60 @@ class MoodEntryOut(MoodEntryCreate):
     class Config:
         from_attributes = True
 
+class MoodHistoryPage(BaseModel):
+    items: List[MoodEntryOut]
+    next_cursor: Optional[str] = None
+
+class MoodSearchHit(MoodEntryOut):
+    rank: float
+
+class MoodSearchPage(BaseModel):
+    items: List[MoodSearchHit]
+    next_cursor: Optional[str] = None
+
+# Запись, накопленная клиентом офлайн: время ставит клиент,
+# client_key защищает от повторной вставки при повторной синхронизации
+class MoodEntryBatchItem(MoodEntryCreate):
+    client_key: str
+    timestamp: Optional[datetime] = None
+
+class MoodBatchItemResult(BaseModel):
+    index: int
+    status: str  # created | duplicate | invalid
+    client_key: Optional[str] = None
+    id: Optional[int] = None
+    timestamp: Optional[datetime] = None
+    error: Optional[str] = None
+
+class MoodBatchOut(BaseModel):
+    created: int
+    duplicates: int
+    invalid: int
+    results: List[MoodBatchItemResult]
+
+class MoodSummaryBucket(BaseModel):
+    period_start: date
+    total: int
+    counts: Dict[str, int]
+    first_at: datetime
+    last_at: datetime
+
+class MoodSummaryOut(BaseModel):
+    bucket: str
+    start: date
+    end: date
+    buckets: List[MoodSummaryBucket]
+
+# Время напоминания в локальном времени пользователя
+class ReminderIn(BaseModel):
+    hour: int = Field(ge=0, le=23)
+    minute: int = Field(ge=0, le=59)
+    utc_offset_minutes: int = Field(0, ge=-720, le=840)
+    enabled: bool = True
+
+class ReminderOut(ReminderIn):
+    pass
+
 # Модели SQLAlchemy для базы данных
 
 class UserDB(Base):
@@ -50,6 +105,7 @@ class UserDB(Base):
     username = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+    avatar_path = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     moods = relationship("MoodEntry", back_populates="user", cascade="all, delete-orphan")
 
@@ -60,4 +116,31 @@ class MoodEntry(Base):
     mood = Column(String, nullable=False)#какое настроение
     details = Column(String, nullable=True)#подробности текстовые типа заметок
     timestamp = Column(DateTime, default=datetime.utcnow)#время
-    user = relationship("UserDB", back_populates="moods")#связь с табличкой UserDB
\ No newline at end of file
+    client_key = Column(String, nullable=True)#ключ идемпотентности от клиента (офлайн-синхронизация)
+    user = relationship("UserDB", back_populates="moods")#связь с табличкой UserDB
+
+    __table_args__ = (
+        Index("ix_mood_entries_user_id_timestamp", "user_id", "timestamp"),
+        Index("uq_mood_entries_user_id_client_key", "user_id", "client_key", unique=True),
+    )
+
+# Дневные агрегаты настроений: одна строка на (пользователь, день, настроение).
+# Обновляются в той же транзакции, что и вставка MoodEntry, поэтому диаграмма
+# за период читает сотни строк вместо всей истории записей.
+class MoodDailyRollup(Base):
+    __tablename__ = "mood_daily_rollups"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    mood = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    first_at = Column(DateTime, nullable=False)#первая запись за день
+    last_at = Column(DateTime, nullable=False)#последняя запись за день
+
+# Расписание напоминаний «не забудь отметить настроение», одно на пользователя
+class ReminderSchedule(Base):
+    __tablename__ = "reminder_schedules"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    minute_of_day = Column(Integer, nullable=False)#минута суток по местному времени
+    utc_offset_minutes = Column(Integer, nullable=False, default=0)#смещение часового пояса
+    enabled = Column(Boolean, nullable=False, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)#по нему планировщик подтягивает изменения
@@ -0,0 +1,368 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from database import AsyncSessionLocal, engine, env_flag
+from models import MoodEntry, ReminderSchedule
+
+logger = logging.getLogger(__name__)
+
+REMINDERS_ENABLED = env_flag("REMINDERS_ENABLED", True)
+REMINDER_SINK_PATH = os.getenv("REMINDER_SINK_PATH", "reminders.ndjson")
+REMINDER_BATCH_SIZE = 1000
+# Как часто подтягивать расписания, изменённые через другие воркеры
+REMINDER_RESYNC_SECONDS = float(os.getenv("REMINDER_RESYNC_SECONDS", "60"))
+# Через сколько повторить пачку, если БД или отправка упали
+REMINDER_RETRY_SECONDS = 30
+# Как часто воркер без блокировки пробует стать рассыльщиком
+REMINDER_LEADER_RETRY_SECONDS = 30
+# Ключ pg_advisory_lock: напоминания рассылает один воркер на весь деплой
+REMINDER_LOCK_KEY = 0x4D4F4F44
+
+DAY_SECONDS = 24 * 60 * 60
+# Смещение часового пояса хранится со сдвигом, чтобы код расписания был неотрицательным
+_OFFSET_SHIFT = 1024
+_SCHEDULE_BITS = 22
+_USER_BITS = 32
+
+@dataclass
+class Reminder:
+    user_id: int
+    due_at: float
+    fired_at: float
+
+# Ближайший момент (unix time, секунды), когда у пользователя наступает minute_of_day
+def next_due(minute_of_day: int, utc_offset_minutes: int, now: float) -> int:
+    local_now = now + utc_offset_minutes * 60
+    local_midnight = local_now - local_now % DAY_SECONDS
+    due = local_midnight + minute_of_day * 60
+    if due <= local_now:
+        due += DAY_SECONDS
+    return int(due - utc_offset_minutes * 60)
+
+# Начало локального дня пользователя для момента due, в наивном UTC
+def local_day_start(due: float, utc_offset_minutes: int) -> datetime:
+    local = due + utc_offset_minutes * 60
+    return datetime.utcfromtimestamp(local - local % DAY_SECONDS - utc_offset_minutes * 60)
+
+# Пишет напоминания в NDJSON-файл — заглушка вместо сервиса push-уведомлений
+class FileSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: str):
+        with open(self.path, "a") as file:
+            file.write(lines)
+
+    async def send(self, reminders: List[Reminder]):
+        lines = "".join(json.dumps(asdict(reminder)) + "\n" for reminder in reminders)
+        await asyncio.to_thread(self._write, lines)
+
+class QueueSink:
+    def __init__(self, queue: Optional[asyncio.Queue] = None):
+        self.queue = queue or asyncio.Queue()
+
+    async def send(self, reminders: List[Reminder]):
+        await self.queue.put(reminders)
+
+# Расписание в памяти планировщика: (minute_of_day, utc_offset_minutes)
+Schedule = Tuple[int, int]
+
+# Кого из пользователей не напоминать и с каким расписанием их оставить.
+# Расписание сверяется с БД: его могли выключить, удалить или поменять через
+# другой воркер (тогда None или новое расписание). Остальных пропускаем, если
+# у них уже есть запись настроения за их сегодня.
+async def users_to_skip(reminders: List[Reminder], schedules: Dict[int, Schedule]) -> Dict[int, Optional[Schedule]]:
+    skip: Dict[int, Optional[Schedule]] = {}
+    by_day_start: Dict[datetime, List[int]] = {}
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(ReminderSchedule.user_id, ReminderSchedule.minute_of_day, ReminderSchedule.utc_offset_minutes)
+            .where(ReminderSchedule.user_id.in_(schedules), ReminderSchedule.enabled.is_(True))
+        )
+        current = {user_id: (minute_of_day, offset) for user_id, minute_of_day, offset in result}
+        for reminder in reminders:
+            schedule = current.get(reminder.user_id)
+            if schedule != schedules[reminder.user_id]:
+                skip[reminder.user_id] = schedule
+                continue
+            day_start = local_day_start(reminder.due_at, schedule[1])
+            by_day_start.setdefault(day_start, []).append(reminder.user_id)
+        for day_start, user_ids in by_day_start.items():
+            result = await session.execute(
+                select(MoodEntry.user_id).distinct()
+                .where(MoodEntry.user_id.in_(user_ids), MoodEntry.timestamp >= day_start)
+            )
+            for user_id in result.scalars():
+                skip[user_id] = schedules[user_id]
+    return skip
+
+# Планировщик напоминаний. На пользователя в памяти лежит только ближайшее
+# срабатывание: куча ключей (due << 32 | user_id) и словарь user_id -> код
+# (due << 22 | расписание). Оба значения — обычные int, без кортежей,
+# поэтому миллион пользователей укладывается в ~150 МБ.
+class ReminderEngine:
+    def __init__(self, sink,
+                 skip_filter: Optional[Callable[[List[Reminder], Dict[int, Schedule]], Awaitable[Dict[int, Optional[Schedule]]]]] = None,
+                 batch_size: int = REMINDER_BATCH_SIZE, clock: Callable[[], float] = time.time,
+                 retry_delay: int = REMINDER_RETRY_SECONDS):
+        self.sink = sink
+        self.skip_filter = skip_filter
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.clock = clock
+        self._heap: List[int] = []
+        self._entries: Dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.fired = 0
+        self.skipped = 0
+        self.batches = 0
+        self.lag_max = 0.0
+        self.lag_sum = 0.0
+        self.retries = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _decode(entry: int):
+        code = entry & ((1 << _SCHEDULE_BITS) - 1)
+        return entry >> _SCHEDULE_BITS, code >> 11, (code & 2047) - _OFFSET_SHIFT
+
+    def schedule(self, user_id: int, minute_of_day: int, utc_offset_minutes: int = 0, due: Optional[int] = None):
+        code = (minute_of_day << 11) | (utc_offset_minutes + _OFFSET_SHIFT)
+        entry = self._entries.get(user_id)
+        if due is None:
+            # То же расписание (повторное сохранение, пересинхронизация) не
+            # сдвигает уже запланированное срабатывание и не плодит ключи в куче
+            if entry is not None and entry & ((1 << _SCHEDULE_BITS) - 1) == code:
+                return
+            due = next_due(minute_of_day, utc_offset_minutes, self.clock())
+        self._entries[user_id] = (due << _SCHEDULE_BITS) | code
+        heapq.heappush(self._heap, (due << _USER_BITS) | user_id)
+        # Устаревшие ключи удаляются лениво; если их стало много — пересобираем кучу
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._compact()
+        if self._heap[0] >> _USER_BITS == due:
+            self._wakeup.set()
+
+    def unschedule(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def _compact(self):
+        self._heap = [((entry >> _SCHEDULE_BITS) << _USER_BITS) | user_id for user_id, entry in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    # Снимает с кучи до batch_size наступивших напоминаний
+    def _pop_due(self, now: float) -> List[int]:
+        user_ids = []
+        heap = self._heap
+        while heap and len(user_ids) < self.batch_size and heap[0] >> _USER_BITS <= now:
+            key = heapq.heappop(heap)
+            user_id = key & ((1 << _USER_BITS) - 1)
+            entry = self._entries.get(user_id)
+            if entry is not None and entry >> _SCHEDULE_BITS == key >> _USER_BITS:
+                user_ids.append(user_id)
+        return user_ids
+
+    async def _dispatch(self, user_ids: List[int], now: float):
+        entries = {user_id: self._entries[user_id] for user_id in user_ids}
+        reminders, schedules = [], {}
+        for user_id, entry in entries.items():
+            due, minute_of_day, offset = self._decode(entry)
+            reminders.append(Reminder(user_id=user_id, due_at=due, fired_at=0.0))
+            schedules[user_id] = (minute_of_day, offset)
+
+        try:
+            skip = await self.skip_filter(reminders, schedules) if self.skip_filter else {}
+            to_send = [reminder for reminder in reminders if reminder.user_id not in skip]
+            fired_at = self.clock()
+            for reminder in to_send:
+                reminder.fired_at = fired_at
+            if to_send:
+                await self.sink.send(to_send)
+        except Exception:
+            # Напоминания за сегодня не теряем: та же пачка ещё раз через retry_delay
+            self.retries += 1
+            retry_at = int(now) + self.retry_delay
+            for user_id, entry in entries.items():
+                if self._entries.get(user_id) == entry:
+                    self.schedule(user_id, *schedules[user_id], due=retry_at)
+            raise
+
+        self.skipped += len(reminders) - len(to_send)
+        self.batches += 1
+        self.fired += len(to_send)
+        for reminder in to_send:
+            lag = reminder.fired_at - reminder.due_at
+            self.lag_sum += lag
+            if lag > self.lag_max:
+                self.lag_max = lag
+        # Следующее срабатывание — по актуальному расписанию и не в прошлом (после
+        # простоя). Если расписание успели поменять во время отправки, оно уже в куче.
+        for user_id, entry in entries.items():
+            if self._entries.get(user_id) != entry:
+                continue
+            schedule = skip.get(user_id, schedules[user_id])
+            if schedule is None:
+                self.unschedule(user_id)
+            else:
+                self.schedule(user_id, *schedule, due=next_due(*schedule, now))
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            now = self.clock()
+            user_ids = self._pop_due(now)
+            if user_ids:
+                try:
+                    await self._dispatch(user_ids, now)
+                except Exception:
+                    logger.exception("Failed to dispatch %s reminders", len(user_ids))
+                continue
+            timeout = (self._heap[0] >> _USER_BITS) - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "scheduled_users": len(self._entries),
+            "heap_size": len(self._heap),
+            "fired": self.fired,
+            "skipped": self.skipped,
+            "batches": self.batches,
+            "lag_avg_s": self.lag_sum / self.fired if self.fired else 0.0,
+            "lag_max_s": self.lag_max,
+            "retries": self.retries,
+        }
+
+scheduler: Optional[ReminderEngine] = None
+_leader_task: Optional[asyncio.Task] = None
+
+# Загружает расписания в планировщик потоком. Без since — все включённые,
+# с since — изменённые после него (в том числе выключенные). Возвращает момент
+# начала загрузки для следующей пересинхронизации.
+async def _load_schedules(engine_: ReminderEngine, since: Optional[datetime] = None) -> datetime:
+    started = datetime.utcnow()
+    query = select(ReminderSchedule.user_id, ReminderSchedule.minute_of_day,
+                   ReminderSchedule.utc_offset_minutes, ReminderSchedule.enabled)
+    if since is None:
+        query = query.where(ReminderSchedule.enabled.is_(True))
+    else:
+        # с запасом на расхождение часов воркеров и поздние коммиты;
+        # повторно применённое то же расписание ничего не меняет
+        query = query.where(ReminderSchedule.updated_at >= since - timedelta(seconds=REMINDER_RESYNC_SECONDS))
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=10000))
+        async for user_id, minute_of_day, utc_offset_minutes, enabled in result:
+            if enabled:
+                engine_.schedule(user_id, minute_of_day, utc_offset_minutes)
+            else:
+                engine_.unschedule(user_id)
+    return started
+
+# Сессионный advisory lock на отдельном соединении, которое держится, пока
+# воркер рассылает напоминания. None — блокировка у другого воркера.
+async def _acquire_leader_lock() -> Optional[AsyncConnection]:
+    conn = await engine.connect()
+    try:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": REMINDER_LOCK_KEY}):
+            return conn
+    except BaseException:
+        await conn.close()
+        raise
+    await conn.close()
+    return None
+
+async def _release_leader_lock(conn: AsyncConnection):
+    try:
+        await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": REMINDER_LOCK_KEY})
+        await conn.close()
+    except Exception:
+        # соединение с неснятой блокировкой в пул не возвращаем
+        await conn.invalidate()
+
+# Рассылкой занимается один воркер: на PostgreSQL тот, кто взял advisory lock,
+# остальные периодически пробуют его перехватить. У SQLite блокировок между
+# процессами нет, поэтому с ней приложение должно работать в одном воркере.
+async def _lead_reminders():
+    global scheduler
+    while True:
+        lock = None
+        try:
+            if engine.dialect.name == "postgresql":
+                lock = await _acquire_leader_lock()
+                if lock is None:
+                    await asyncio.sleep(REMINDER_LEADER_RETRY_SECONDS)
+                    continue
+            scheduler = ReminderEngine(FileSink(REMINDER_SINK_PATH), skip_filter=users_to_skip)
+            synced_at = await _load_schedules(scheduler)
+            scheduler.start()
+            logger.info("Reminder scheduler started with %s users", len(scheduler))
+            while True:
+                await asyncio.sleep(REMINDER_RESYNC_SECONDS)
+                if lock is not None:
+                    # блокировка живёт, пока живо соединение
+                    await lock.execute(text("SELECT 1"))
+                synced_at = await _load_schedules(scheduler, since=synced_at)
+        except Exception:
+            logger.exception("Reminder scheduler failed, restarting")
+        finally:
+            if scheduler is not None:
+                await scheduler.stop()
+                scheduler = None
+            if lock is not None:
+                await _release_leader_lock(lock)
+        await asyncio.sleep(REMINDER_LEADER_RETRY_SECONDS)
+
+async def start_reminders():
+    global _leader_task
+    if REMINDERS_ENABLED and _leader_task is None:
+        _leader_task = asyncio.create_task(_lead_reminders())
+
+async def stop_reminders():
+    global _leader_task
+    if _leader_task is not None:
+        _leader_task.cancel()
+        try:
+            await _leader_task
+        except asyncio.CancelledError:
+            pass
+        _leader_task = None
+
+# Синхронизирует планировщик с сохранённым расписанием пользователя
+def apply_reminder_schedule(schedule: ReminderSchedule):
+    if scheduler is None:
+        return
+    if schedule.enabled:
+        scheduler.schedule(schedule.user_id, schedule.minute_of_day, schedule.utc_offset_minutes)
+    else:
+        scheduler.unschedule(schedule.user_id)
+
+def remove_reminder_schedule(user_id: int):
+    if scheduler is not None:
+        scheduler.unschedule(user_id)
@@ -0,0 +1,117 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Tuple
+from sqlalchemy import Date, case, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import dialect_insert, engine
+from models import MoodDailyRollup, MoodEntry, MoodSummaryBucket
+
+# Инкрементально обновляет дневные агрегаты для новых записей (mood, timestamp).
+# Вызывается внутри транзакции вставки, коммит остаётся за вызывающим кодом.
+async def apply_mood_rollups(db: AsyncSession, user_id: int, entries: Iterable[Tuple[str, datetime]]):
+    await apply_mood_rollups_many(db, ((user_id, mood, timestamp) for mood, timestamp in entries))
+
+# Строки upsert агрегатов, отсортированные по ключу (user_id, day, mood):
+# параллельные транзакции (флашеры разных воркеров, пакетные загрузки)
+# блокируют одни и те же строки в одном порядке и не попадают в deadlock
+def rollup_rows(entries: Iterable[Tuple[int, str, datetime]]) -> List[dict]:
+    grouped = {}
+    for user_id, mood, timestamp in entries:
+        key = (user_id, timestamp.date(), mood)
+        if key in grouped:
+            count, first_at, last_at = grouped[key]
+            grouped[key] = (count + 1, min(first_at, timestamp), max(last_at, timestamp))
+        else:
+            grouped[key] = (1, timestamp, timestamp)
+    return [
+        {"user_id": user_id, "day": day, "mood": mood,
+         "count": count, "first_at": first_at, "last_at": last_at}
+        for (user_id, day, mood), (count, first_at, last_at) in sorted(grouped.items())
+    ]
+
+# Обновляет агрегаты для записей разных пользователей: (user_id, mood, timestamp)
+async def apply_mood_rollups_many(db: AsyncSession, entries: Iterable[Tuple[int, str, datetime]]):
+    rows = rollup_rows(entries)
+    if not rows:
+        return
+    insert = dialect_insert(db)
+    stmt = insert(MoodDailyRollup).values(rows)
+    table = MoodDailyRollup.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.day, table.c.mood],
+        set_={
+            "count": table.c.count + stmt.excluded.count,
+            "first_at": case((stmt.excluded.first_at < table.c.first_at, stmt.excluded.first_at),
+                             else_=table.c.first_at),
+            "last_at": case((stmt.excluded.last_at > table.c.last_at, stmt.excluded.last_at),
+                            else_=table.c.last_at),
+        },
+    )
+    await db.execute(stmt)
+
+# Заполняет агрегаты по уже существующим записям. Каждая вставка записи
+# обновляет агрегаты, поэтому пустая таблица при непустой истории значит, что
+# заполнение ещё не прошло (в том числе если прошлый запуск упал на нём) —
+# проверка и заполнение идут в одной транзакции и повторяются при запуске.
+async def backfill_mood_rollups():
+    async with engine.begin() as conn:
+        if await conn.scalar(select(MoodDailyRollup.user_id).limit(1)) is not None:
+            return
+        if await conn.scalar(select(MoodEntry.id).limit(1)) is None:
+            return
+        if conn.dialect.name == "sqlite":
+            day = func.date(MoodEntry.timestamp)
+        else:
+            day = cast(MoodEntry.timestamp, Date)
+        totals = (
+            select(MoodEntry.user_id, day, MoodEntry.mood, func.count(),
+                   func.min(MoodEntry.timestamp), func.max(MoodEntry.timestamp))
+            .where(MoodEntry.user_id.is_not(None), MoodEntry.timestamp.is_not(None))
+            .group_by(MoodEntry.user_id, day, MoodEntry.mood)
+        )
+        insert = dialect_insert(conn)
+        await conn.execute(
+            insert(MoodDailyRollup)
+            .from_select(["user_id", "day", "mood", "count", "first_at", "last_at"], totals)
+            .on_conflict_do_nothing()
+        )
+
+# Начало периода, в который попадает день
+def bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+# Сводка настроений за [start, end] по дневным агрегатам, сгруппированная по периодам
+async def summarize_moods(db: AsyncSession, user_id: int, start: date, end: date, bucket: str) -> List[MoodSummaryBucket]:
+    result = await db.execute(
+        select(MoodDailyRollup.day, MoodDailyRollup.mood, MoodDailyRollup.count,
+               MoodDailyRollup.first_at, MoodDailyRollup.last_at)
+        .where(MoodDailyRollup.user_id == user_id,
+               MoodDailyRollup.day >= start,
+               MoodDailyRollup.day <= end)
+        .order_by(MoodDailyRollup.day)
+    )
+    periods = {}
+    for day, mood, count, first_at, last_at in result:
+        period = periods.get(bucket_start(day, bucket))
+        if period is None:
+            period = periods[bucket_start(day, bucket)] = {
+                "counts": defaultdict(int), "first_at": first_at, "last_at": last_at,
+            }
+        period["counts"][mood] += count
+        period["first_at"] = min(period["first_at"], first_at)
+        period["last_at"] = max(period["last_at"], last_at)
+
+    return [
+        MoodSummaryBucket(
+            period_start=period_start,
+            total=sum(period["counts"].values()),
+            counts=dict(period["counts"]),
+            first_at=period["first_at"],
+            last_at=period["last_at"],
+        )
+        for period_start, period in periods.items()
+    ]
@@ -0,0 +1,203 @@
+import asyncio
+import base64
+import heapq
+import logging
+import math
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, func, literal_column, or_, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from cache import TTLCache
+from database import engine
+from models import MoodEntry
+
+logger = logging.getLogger(__name__)
+
+# Конфигурация полнотекстового поиска PostgreSQL: без стемминга,
+# одинаково работает для русских и английских заметок
+SEARCH_TS_CONFIG = "simple"
+
+# Сколько пользователей держать в памяти для индекса без PostgreSQL
+SEARCH_INDEX_USERS = 100
+SEARCH_INDEX_TTL_SECONDS = 3600
+
+_TOKEN_RE = re.compile(r"\w+")
+
+class InvalidSearchCursor(ValueError):
+    pass
+
+def tokenize(text_value: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall(text_value.lower()) if text_value else []
+
+def encode_search_cursor(rank: float, entry_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{rank!r}|{entry_id}".encode()).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        rank, entry_id = raw.split("|")
+        return float(rank), int(entry_id)
+    except ValueError:
+        raise InvalidSearchCursor("Invalid cursor")
+
+# В PostgreSQL индекс — сгенерированный tsvector-столбец, он обновляется
+# самой базой при вставке записи. Поиск всегда идёт по одному пользователю,
+# поэтому GIN-индекс составной (user_id, details_tsv) через btree_gin: иначе
+# по частому слову база достаёт совпадения всех пользователей и лишь потом
+# отбрасывает чужие, и время поиска растёт с размером всей базы.
+async def create_search_index(db_engine=engine):
+    if db_engine.dialect.name != "postgresql":
+        return
+    async with db_engine.begin() as conn:
+        await conn.execute(text(
+            "ALTER TABLE mood_entries ADD COLUMN IF NOT EXISTS details_tsv tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_TS_CONFIG}', coalesce(details, ''))) STORED"
+        ))
+        try:
+            async with conn.begin_nested():
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+        except DBAPIError:
+            logger.warning("btree_gin extension is unavailable, search index will not include user_id")
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_mood_entries_details_tsv ON mood_entries USING GIN (details_tsv)"
+            ))
+            return
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_mood_entries_user_id_details_tsv "
+            "ON mood_entries USING GIN (user_id, details_tsv)"
+        ))
+        # индекс только по details_tsv из прошлых версий больше не нужен
+        await conn.execute(text("DROP INDEX IF EXISTS ix_mood_entries_details_tsv"))
+
+# Обратный индекс заметок одного пользователя для баз без tsvector (SQLite)
+class UserNotesIndex:
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}  # слово -> {id записи: частота}
+        self.timestamps: Dict[int, datetime] = {}
+        self.lengths: Dict[int, int] = {}  # id записи -> число слов
+
+    def add(self, entry_id: int, timestamp: datetime, details: Optional[str]):
+        if entry_id in self.timestamps:
+            return
+        tokens = tokenize(details)
+        self.timestamps[entry_id] = timestamp
+        self.lengths[entry_id] = len(tokens)
+        for token in tokens:
+            postings = self.postings.setdefault(token, {})
+            postings[entry_id] = postings.get(entry_id, 0) + 1
+
+    # Лучшие count записей, где встречаются все слова запроса и которые идут
+    # после курсора after = (rank, id). Как и ts_rank, вес зависит только от
+    # самой записи (частоты слов и её длины), а не от остальных заметок:
+    # новые записи не меняют ранг старых, и курсор остаётся верным.
+    def search(self, terms: List[str], start: Optional[datetime], end: Optional[datetime],
+               after: Optional[Tuple[float, int]], count: int) -> List[Tuple[float, int]]:
+        if not terms or any(term not in self.postings for term in terms):
+            return []
+        postings = sorted((self.postings[term] for term in set(terms)), key=len)
+        timestamps = self.timestamps
+        lengths = self.lengths
+        hits = []
+        for entry_id, frequency in postings[0].items():
+            if start or end:
+                timestamp = timestamps[entry_id]
+                if (start and timestamp < start) or (end and timestamp >= end):
+                    continue
+            for other in postings[1:]:
+                other_frequency = other.get(entry_id)
+                if other_frequency is None:
+                    break
+                frequency += other_frequency
+            else:
+                hit = (frequency / (1 + math.log(lengths[entry_id])), entry_id)
+                if after is None or hit < after:
+                    hits.append(hit)
+        return heapq.nlargest(count, hits)
+
+# TTL продлевается при каждом поиске, чтобы активным пользователям индекс
+# не перестраивался каждый час
+_notes_indexes = TTLCache(maxsize=SEARCH_INDEX_USERS, ttl=SEARCH_INDEX_TTL_SECONDS, sliding=True)
+# Индексы, которые сейчас строятся: user_id -> (индекс, событие «построен»)
+_building_indexes: Dict[int, Tuple[UserNotesIndex, asyncio.Event]] = {}
+
+# Добавляет новую запись в индекс, если он уже построен или строится для пользователя
+def index_mood_entry(user_id: int, entry_id: int, timestamp: datetime, details: Optional[str]):
+    if engine.dialect.name == "postgresql" or not details:
+        return
+    index = _notes_indexes.get(user_id)
+    if index is None and user_id in _building_indexes:
+        index = _building_indexes[user_id][0]
+    if index is not None:
+        index.add(entry_id, timestamp, details)
+
+# Индекс попадает в кэш только целиком построенным; параллельные поиски
+# того же пользователя ждут одну сборку, а если она упала — строят заново
+async def _user_notes_index(db: AsyncSession, user_id: int) -> UserNotesIndex:
+    while True:
+        index = _notes_indexes.get(user_id)
+        if index is not None:
+            return index
+        building = _building_indexes.get(user_id)
+        if building is None:
+            break
+        await building[1].wait()
+
+    index = UserNotesIndex()
+    built = asyncio.Event()
+    _building_indexes[user_id] = (index, built)
+    try:
+        result = await db.stream(
+            select(MoodEntry.id, MoodEntry.timestamp, MoodEntry.details)
+            .where(MoodEntry.user_id == user_id, MoodEntry.details.is_not(None))
+            .execution_options(yield_per=5000)
+        )
+        async for entry_id, timestamp, details in result:
+            index.add(entry_id, timestamp, details)
+        _notes_indexes.set(user_id, index)
+    finally:
+        del _building_indexes[user_id]
+        built.set()
+    return index
+
+def _date_bounds(start: Optional[date], end: Optional[date]):
+    start_at = datetime.combine(start, datetime.min.time()) if start else None
+    end_at = datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None
+    return start_at, end_at
+
+async def _search_postgres(db, user_id, query, start_at, end_at, after, limit):
+    tsquery = func.plainto_tsquery(SEARCH_TS_CONFIG, query)
+    tsvector = literal_column("mood_entries.details_tsv")
+    rank = func.ts_rank(tsvector, tsquery)
+    stmt = select(MoodEntry, rank.label("rank")).where(MoodEntry.user_id == user_id, tsvector.op("@@")(tsquery))
+    if start_at:
+        stmt = stmt.where(MoodEntry.timestamp >= start_at)
+    if end_at:
+        stmt = stmt.where(MoodEntry.timestamp < end_at)
+    if after:
+        stmt = stmt.where(or_(rank < after[0], and_(rank == after[0], MoodEntry.id < after[1])))
+    stmt = stmt.order_by(rank.desc(), MoodEntry.id.desc()).limit(limit + 1)
+    return [(entry, float(entry_rank)) for entry, entry_rank in await db.execute(stmt)]
+
+async def _search_fallback(db, user_id, query, start_at, end_at, after, limit):
+    index = await _user_notes_index(db, user_id)
+    hits = index.search(tokenize(query), start_at, end_at, after, limit + 1)
+    if not hits:
+        return []
+    result = await db.execute(select(MoodEntry).where(MoodEntry.id.in_([entry_id for _, entry_id in hits])))
+    entries = {entry.id: entry for entry in result.scalars()}
+    return [(entries[entry_id], rank) for rank, entry_id in hits if entry_id in entries]
+
+# Поиск по заметкам: самые релевантные записи первыми, курсор по (rank, id)
+async def search_mood_entries(db: AsyncSession, user_id: int, query: str, start: Optional[date], end: Optional[date],
+                              cursor: Optional[str], limit: int) -> Tuple[List[Tuple[MoodEntry, float]], Optional[str]]:
+    after = decode_search_cursor(cursor) if cursor else None
+    start_at, end_at = _date_bounds(start, end)
+    search = _search_postgres if db.bind.dialect.name == "postgresql" else _search_fallback
+    hits = await search(db, user_id, query, start_at, end_at, after, limit)
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_search_cursor(hits[-1][1], hits[-1][0].id)
+    return hits, next_cursor
@@ -0,0 +1,62 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import httpx
+import pytest
+
+# Настройки читаются при импорте модулей, поэтому задаются до импорта main:
+# отдельная SQLite-база, быстрый хэш паролей, без планировщика напоминаний
+_workdir = tempfile.mkdtemp(prefix="mood-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ["DB_ECHO"] = "false"
+os.environ["REMINDERS_ENABLED"] = "false"
+os.environ["MOOD_WRITE_BEHIND"] = "false"
+os.environ["PASSWORD_HASH_EXECUTOR"] = "thread"
+os.environ["PASSWORD_HASH_ROUNDS"] = "1000"
+# аватары пишутся в static/ относительно текущего каталога
+os.chdir(_workdir)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+_user_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def app():
+    await main.startup()
+    yield main.app
+    await main.shutdown()
+
+
+@pytest.fixture
+async def client(app):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+# Регистрирует нового пользователя и возвращает (username, заголовки с токеном)
+@pytest.fixture
+def make_user(client):
+    async def make():
+        username = f"user{next(_user_numbers)}"
+        response = await client.post(
+            "/register", json={"username": username, "email": f"{username}@example.com", "password": "secret123"}
+        )
+        assert response.status_code == 200, response.text
+        return username, await _login(client, username)
+    return make
+
+
+async def _login(client, username, password="secret123"):
+    response = await client.post("/token", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
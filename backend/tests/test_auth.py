@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import select
+
+import auth
+from database import AsyncSessionLocal
+from models import UserDB
+
+pytestmark = pytest.mark.anyio
+
+
+async def _stored_hash(username):
+    async with AsyncSessionLocal() as session:
+        return await session.scalar(select(UserDB.hashed_password).where(UserDB.username == username))
+
+
+async def _login(client, username):
+    return await client.post("/token", data={"username": username, "password": "secret123"})
+
+
+async def test_login_rehashes_when_rounds_change(client, make_user, monkeypatch):
+    username, _ = await make_user()
+    assert (await _stored_hash(username)).startswith("$5$rounds=1000$")
+
+    monkeypatch.setattr(auth, "pwd_context", auth.make_password_context("sha256_crypt", 2000))
+    # без PASSWORD_REHASH_ON_LOGIN хэш не трогаем
+    assert (await _login(client, username)).status_code == 200
+    assert (await _stored_hash(username)).startswith("$5$rounds=1000$")
+
+    monkeypatch.setattr(auth, "PASSWORD_REHASH_ON_LOGIN", True)
+    assert (await _login(client, username)).status_code == 200
+    assert (await _stored_hash(username)).startswith("$5$rounds=2000$")
+
+
+async def test_scheme_change_keeps_old_hashes_valid(client, make_user, monkeypatch):
+    username, _ = await make_user()
+    monkeypatch.setattr(auth, "pwd_context", auth.make_password_context("pbkdf2_sha256", 1000, ["sha256_crypt"]))
+    assert (await _login(client, username)).status_code == 200
+    assert (await _stored_hash(username)).startswith("$5$")
+
+    monkeypatch.setattr(auth, "PASSWORD_REHASH_ON_LOGIN", True)
+    assert (await _login(client, username)).status_code == 200
+    assert (await _stored_hash(username)).startswith("$pbkdf2-sha256$1000$")
+    assert (await _login(client, username)).status_code == 200
+    response = await client.post("/token", data={"username": username, "password": "wrong"})
+    assert response.status_code == 401
+
+
+async def test_hash_pool_rejects_when_queue_is_full(client, make_user, monkeypatch):
+    username, _ = await make_user()
+    monkeypatch.setattr(auth, "PASSWORD_HASH_WORKERS", 1)
+    monkeypatch.setattr(auth, "PASSWORD_HASH_MAX_QUEUE", 1)
+    release = threading.Event()
+    # два долгих задания занимают воркер и единственное место в очереди
+    busy = [asyncio.create_task(auth._run_in_hash_pool(release.wait, 5)) for _ in range(2)]
+    await asyncio.sleep(0)
+    rejected = auth.hash_pool_stats()["rejected"]
+    try:
+        response = await _login(client, username)
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert auth.hash_pool_stats()["rejected"] == rejected + 1
+    finally:
+        release.set()
+        await asyncio.gather(*busy)
+    assert auth.hash_pool_stats()["pending"] == 0
+    assert (await _login(client, username)).status_code == 200
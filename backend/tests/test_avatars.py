@@ -0,0 +1,38 @@
+import io
+
+import pytest
+from PIL import Image
+
+pytestmark = pytest.mark.anyio
+
+
+def _png() -> bytes:
+    data = io.BytesIO()
+    Image.new("RGB", (32, 32), "teal").save(data, "PNG")
+    return data.getvalue()
+
+
+async def test_avatar_upload_and_conditional_get(client, make_user):
+    _, headers = await make_user()
+    response = await client.put("/users/me/update", files={"avatar": ("me.png", _png(), "image/png")}, headers=headers)
+    assert response.status_code == 200
+    avatar_path = (await client.get("/users/me", headers=headers)).json()["avatar_path"]
+    assert avatar_path.startswith("/avatars/")
+
+    response = await client.get(avatar_path)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    etag = response.headers["etag"]
+    assert (await client.get(avatar_path, headers={"If-None-Match": etag})).status_code == 304
+
+    # ETag от несуществующего файла не даёт 304
+    missing = "/avatars/" + "0" * 64 + ".png"
+    assert (await client.get(missing, headers={"If-None-Match": f'"{"0" * 64}-orig"'})).status_code == 404
+
+
+async def test_avatar_content_must_match_extension(client, make_user):
+    _, headers = await make_user()
+    for name, content in (("me.png", b"<html>not an image</html>"), ("me.jpg", _png()), ("me.png", b"\x89PNG\r\n\x1a\n" + b"x" * 64)):
+        response = await client.put("/users/me/update", files={"avatar": (name, content, "image/png")}, headers=headers)
+        assert response.status_code == 415, name
+    assert (await client.get("/users/me", headers=headers)).json()["avatar_path"] is None
@@ -0,0 +1,46 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_batch_replay_marks_duplicates(client, make_user):
+    _, headers = await make_user()
+    items = [
+        {"mood": "happy", "client_key": "a"},
+        {"mood": "sad", "client_key": "b", "timestamp": "2026-01-01T10:00:00+03:00"},
+        {"mood": "calm", "client_key": "a"},
+        {"client_key": "c"},
+    ]
+    first = (await client.post("/mood/batch", json=items, headers=headers)).json()
+    assert (first["created"], first["duplicates"], first["invalid"]) == (2, 1, 1)
+    statuses = [result["status"] for result in first["results"]]
+    assert statuses == ["created", "created", "duplicate", "invalid"]
+    # повтор внутри пачки ссылается на первую запись, время клиента приведено к UTC
+    assert first["results"][2]["id"] == first["results"][0]["id"]
+    assert first["results"][1]["timestamp"] == "2026-01-01T07:00:00"
+
+    # повторная синхронизация (NDJSON) ничего не вставляет и возвращает те же id
+    body = "\n".join('{"mood": "happy", "client_key": "%s"}' % key for key in ("a", "b"))
+    replay = (await client.post(
+        "/mood/batch", content=body, headers={**headers, "Content-Type": "application/x-ndjson"}
+    )).json()
+    assert (replay["created"], replay["duplicates"]) == (0, 2)
+    assert [result["id"] for result in replay["results"]] == [result["id"] for result in first["results"][:2]]
+
+    history = (await client.get("/mood", headers=headers)).json()
+    assert len(history["items"]) == 2
+
+
+async def test_batch_rejects_malformed_and_oversized_bodies(client, make_user):
+    _, headers = await make_user()
+    response = await client.post("/mood/batch", content=b"{not json", headers=headers)
+    assert response.status_code == 400
+    response = await client.post("/mood/batch", content=b"[" + b" " * (5 * 1024 * 1024) + b"]", headers=headers)
+    assert response.status_code == 413
+
+    # без Content-Length лимит считается по мере чтения тела
+    async def chunks():
+        for _ in range(80):
+            yield b" " * 65536
+    response = await client.post("/mood/batch", content=chunks(), headers=headers)
+    assert response.status_code == 413
@@ -0,0 +1,68 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import history
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_history_keyset_pages(client, make_user):
+    _, headers = await make_user()
+    base = datetime(2026, 3, 1, 12, 0)
+    # у части записей одинаковое время: порядок внутри них задаёт id
+    items = [
+        {"mood": f"m{index}", "client_key": str(index), "timestamp": (base + timedelta(minutes=index // 2)).isoformat()}
+        for index in range(7)
+    ]
+    created = (await client.post("/mood/batch", json=items, headers=headers)).json()
+    assert created["created"] == 7
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get("/mood", params=params, headers=headers)).json()
+        pages.append(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [3, 3, 1]
+    entries = [entry for page in pages for entry in page]
+    keys = [(entry["timestamp"], entry["id"]) for entry in entries]
+    assert keys == sorted(keys, reverse=True)
+    assert len({entry["id"] for entry in entries}) == 7
+
+    response = await client.get("/mood", params={"cursor": "garbage"}, headers=headers)
+    assert response.status_code == 400
+
+
+async def test_export_streams_whole_history(client, make_user, monkeypatch):
+    _, headers = await make_user()
+    # маленькие порции, чтобы выгрузка пришла несколькими кусками
+    monkeypatch.setattr(history, "EXPORT_CHUNK_ROWS", 2)
+    items = [
+        {"mood": "ok", "details": 'note, with "quotes"\nand a newline' if index == 0 else f"заметка {index}",
+         "client_key": str(index), "timestamp": f"2026-04-0{index + 1}T08:00:00"}
+        for index in range(5)
+    ]
+    await client.post("/mood/batch", json=items, headers=headers)
+
+    response = await client.get("/mood/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="mood.csv"'
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == list(history.EXPORT_COLUMNS)
+    assert [row[3] for row in rows[1:]] == [item["details"] for item in items]
+    assert rows[1][1] == "2026-04-01T08:00:00"
+
+    response = await client.get("/mood/export", params={"format": "ndjson"}, headers=headers)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["details"] for line in lines] == [item["details"] for item in items]
+    assert set(lines[0]) == set(history.EXPORT_COLUMNS)
+
+    assert (await client.get("/mood/export", params={"format": "xml"}, headers=headers)).status_code == 422
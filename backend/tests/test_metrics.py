@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import metrics
+from database import engine
+
+pytestmark = pytest.mark.anyio
+
+
+def _parse(body: str) -> dict:
+    values = {}
+    for line in body.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return values
+
+
+async def test_metrics_count_requests_and_queries(client, make_user):
+    _, headers = await make_user()
+    before = _parse((await client.get("/metrics")).text)
+    for _ in range(3):
+        assert (await client.get("/mood", headers=headers)).status_code == 200
+    assert (await client.get("/mood", params={"cursor": "bad"}, headers=headers)).status_code == 400
+
+    response = await client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = _parse(response.text)
+    route = 'route="GET /mood"'
+    # маршрут подписан шаблоном пути, а не конкретным URL
+    assert after[f"http_request_duration_ms_count{{{route}}}"] - before.get(f"http_request_duration_ms_count{{{route}}}", 0) == 4
+    assert after[f'http_request_duration_ms_bucket{{{route},le="+Inf"}}'] == after[f"http_request_duration_ms_count{{{route}}}"]
+    # 4xx — не ошибка сервера
+    assert after[f"http_request_errors_total{{{route}}}"] == before.get(f"http_request_errors_total{{{route}}}", 0)
+    assert after[f"http_request_db_queries_total{{{route}}}"] > before.get(f"http_request_db_queries_total{{{route}}}", 0)
+    assert after["db_queries_total"] > before["db_queries_total"]
+    assert after['auth_cache_hits{cache="users"}'] >= 3
+    assert "password_hash_rejected_total" in after
+    # сам /metrics ещё выполняется, пока строит ответ
+    assert after["http_requests_in_flight"] == 1
+
+
+async def test_failed_query_does_not_leak_start_time():
+    errors = metrics.query_errors_total
+    async with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            await conn.execute(text("SELECT * FROM no_such_table"))
+        assert conn.sync_connection.info["query_started"] == []
+        await conn.execute(text("SELECT 1"))
+        assert conn.sync_connection.info["query_started"] == []
+    assert metrics.query_errors_total == errors + 1
+    assert f"db_query_errors_total {errors + 1}" in metrics.render_metrics()
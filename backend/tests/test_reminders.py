@@ -0,0 +1,76 @@
+import pytest
+
+from reminders import DAY_SECONDS, QueueSink, ReminderEngine, next_due
+
+pytestmark = pytest.mark.anyio
+
+MIDNIGHT = 20_000 * DAY_SECONDS
+
+
+def test_next_due_respects_offset():
+    # 09:00 по Москве (UTC+3) — это 06:00 UTC
+    assert next_due(9 * 60, 180, MIDNIGHT) == MIDNIGHT + 6 * 3600
+    # время уже прошло — срабатывание завтра
+    assert next_due(9 * 60, 180, MIDNIGHT + 7 * 3600) == MIDNIGHT + DAY_SECONDS + 6 * 3600
+
+
+def test_engine_packs_and_decodes_schedule():
+    engine = ReminderEngine(QueueSink(), clock=lambda: MIDNIGHT)
+    cases = {1: (0, -720), 2: (1439, 840), 3: (9 * 60, 0), 2**32 - 1: (615, 330)}
+    for user_id, (minute_of_day, offset) in cases.items():
+        engine.schedule(user_id, minute_of_day, offset)
+    for user_id, (minute_of_day, offset) in cases.items():
+        assert ReminderEngine._decode(engine._entries[user_id]) == (
+            next_due(minute_of_day, offset, MIDNIGHT), minute_of_day, offset,
+        )
+    # повторное сохранение того же расписания не добавляет ключей в кучу
+    heap_size = len(engine._heap)
+    engine.schedule(3, 9 * 60, 0)
+    assert len(engine._heap) == heap_size
+
+    due_order = sorted(cases, key=lambda user_id: (next_due(*cases[user_id], MIDNIGHT), user_id))
+    assert engine._pop_due(MIDNIGHT + 2 * DAY_SECONDS) == due_order
+
+
+async def test_dispatch_reschedules_after_send():
+    sink = QueueSink()
+    now = MIDNIGHT + 9 * 3600
+    engine = ReminderEngine(sink, clock=lambda: now)
+    engine.schedule(1, 9 * 60, 0, due=MIDNIGHT + 9 * 3600)
+    await engine._dispatch(engine._pop_due(now), now)
+    sent = sink.queue.get_nowait()
+    assert [reminder.user_id for reminder in sent] == [1]
+    assert ReminderEngine._decode(engine._entries[1]) == (MIDNIGHT + DAY_SECONDS + 9 * 3600, 9 * 60, 0)
+
+
+async def test_dispatch_failure_retries_batch():
+    class BrokenSink:
+        async def send(self, reminders):
+            raise ConnectionError("push service is down")
+
+    now = MIDNIGHT + 9 * 3600
+    engine = ReminderEngine(BrokenSink(), clock=lambda: now, retry_delay=30)
+    engine.schedule(1, 9 * 60, 0, due=now)
+    with pytest.raises(ConnectionError):
+        await engine._dispatch(engine._pop_due(now), now)
+    assert ReminderEngine._decode(engine._entries[1]) == (now + 30, 9 * 60, 0)
+    assert engine.stats()["retries"] == 1 and engine.fired == 0
+
+
+async def test_dispatch_applies_schedules_from_skip_filter():
+    async def skip_filter(reminders, schedules):
+        # 2 выключил напоминания, 3 перенёс их на 10:00, 4 уже отметился сегодня
+        return {2: None, 3: (10 * 60, 0), 4: schedules[4]}
+
+    sink = QueueSink()
+    now = MIDNIGHT + 9 * 3600
+    engine = ReminderEngine(sink, skip_filter=skip_filter, clock=lambda: now)
+    for user_id in (1, 2, 3, 4):
+        engine.schedule(user_id, 9 * 60, 0, due=now)
+    await engine._dispatch(engine._pop_due(now), now)
+
+    assert [reminder.user_id for reminder in sink.queue.get_nowait()] == [1]
+    assert 2 not in engine._entries
+    assert ReminderEngine._decode(engine._entries[3]) == (MIDNIGHT + 10 * 3600, 10 * 60, 0)
+    assert ReminderEngine._decode(engine._entries[4])[0] == now + DAY_SECONDS
+    assert (engine.fired, engine.skipped) == (1, 3)
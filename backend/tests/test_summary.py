@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import delete, select
+
+from database import engine
+from models import MoodDailyRollup
+from rollups import backfill_mood_rollups
+
+pytestmark = pytest.mark.anyio
+
+
+def _entry(key, mood, timestamp):
+    return {"mood": mood, "client_key": key, "timestamp": timestamp}
+
+
+async def test_summary_merges_rollups_across_inserts(client, make_user):
+    _, headers = await make_user()
+    await client.post("/mood/batch", headers=headers, json=[
+        _entry("1", "happy", "2026-02-02T12:00:00"),
+        _entry("2", "happy", "2026-02-02T09:00:00"),
+        _entry("3", "sad", "2026-02-03T10:00:00"),
+    ])
+    # вторая вставка в тот же день и настроение складывается с агрегатом
+    await client.post("/mood/batch", headers=headers, json=[_entry("4", "happy", "2026-02-02T21:30:00")])
+    assert (await client.post("/mood", json={"mood": "calm"}, headers=headers)).status_code == 200
+
+    response = await client.get("/mood/summary", params={"from": "2026-02-01", "to": "2026-02-28"}, headers=headers)
+    assert response.status_code == 200
+    assert "summary;dur=" in response.headers["server-timing"]
+    buckets = response.json()["buckets"]
+    assert [bucket["period_start"] for bucket in buckets] == ["2026-02-02", "2026-02-03"]
+    assert buckets[0]["counts"] == {"happy": 3} and buckets[0]["total"] == 3
+    assert (buckets[0]["first_at"], buckets[0]["last_at"]) == ("2026-02-02T09:00:00", "2026-02-02T21:30:00")
+
+    # без дат — последние 30 дней, куда попадает только сегодняшняя запись
+    recent = (await client.get("/mood/summary", headers=headers)).json()["buckets"]
+    assert [bucket["counts"] for bucket in recent] == [{"calm": 1}]
+
+
+async def test_summary_week_and_month_buckets(client, make_user):
+    _, headers = await make_user()
+    await client.post("/mood/batch", headers=headers, json=[
+        _entry("1", "happy", "2026-03-29T08:00:00"),  # воскресенье
+        _entry("2", "sad", "2026-03-30T08:00:00"),  # понедельник, следующая неделя
+        _entry("3", "happy", "2026-03-31T20:00:00"),
+        _entry("4", "happy", "2026-04-01T07:00:00"),
+    ])
+    params = {"from": "2026-03-01", "to": "2026-04-30"}
+    weeks = (await client.get("/mood/summary", params={**params, "bucket": "week"}, headers=headers)).json()
+    assert [(bucket["period_start"], bucket["counts"]) for bucket in weeks["buckets"]] == [
+        ("2026-03-23", {"happy": 1}),
+        ("2026-03-30", {"sad": 1, "happy": 2}),
+    ]
+    months = (await client.get("/mood/summary", params={**params, "bucket": "month"}, headers=headers)).json()
+    assert [(bucket["period_start"], bucket["total"]) for bucket in months["buckets"]] == [
+        ("2026-03-01", 3), ("2026-04-01", 1),
+    ]
+    assert months["buckets"][0]["last_at"] == "2026-03-31T20:00:00"
+
+    response = await client.get("/mood/summary", params={"from": "2026-04-02", "to": "2026-04-01"}, headers=headers)
+    assert response.status_code == 400
+
+
+async def test_backfill_rebuilds_missing_rollups_once(client, make_user):
+    _, headers = await make_user()
+    await client.post("/mood/batch", headers=headers, json=[
+        _entry("1", "happy", "2026-05-05T08:00:00"), _entry("2", "happy", "2026-05-05T18:00:00"),
+    ])
+    columns = [MoodDailyRollup.user_id, MoodDailyRollup.day, MoodDailyRollup.mood, MoodDailyRollup.count,
+               MoodDailyRollup.first_at, MoodDailyRollup.last_at]
+
+    async def snapshot():
+        async with engine.connect() as conn:
+            return sorted((await conn.execute(select(*columns))).all())
+
+    expected = await snapshot()
+    # как после запуска, упавшего между созданием таблицы и её заполнением
+    async with engine.begin() as conn:
+        await conn.execute(delete(MoodDailyRollup))
+    await backfill_mood_rollups()
+    assert await snapshot() == expected
+    # уже заполненные агрегаты повторно не суммируются
+    await backfill_mood_rollups()
+    assert await snapshot() == expected
@@ -0,0 +1,20 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_update_invalidates_cached_user(client, make_user):
+    username, headers = await make_user()
+    assert (await client.get("/users/me", headers=headers)).json()["username"] == username
+
+    response = await client.put("/users/me/update", params={"email": f"new-{username}@example.com"}, headers=headers)
+    assert response.status_code == 200
+    assert (await client.get("/users/me", headers=headers)).json()["email"] == f"new-{username}@example.com"
+
+    # после переименования старый токен указывает на несуществующее имя
+    response = await client.put("/users/me/update", params={"username": f"{username}-renamed"}, headers=headers)
+    assert response.status_code == 200
+    assert (await client.get("/users/me", headers=headers)).status_code == 401
+    token = (await client.post("/token", data={"username": f"{username}-renamed", "password": "secret123"})).json()
+    me = await client.get("/users/me", headers={"Authorization": f"Bearer {token['access_token']}"})
+    assert me.json()["username"] == f"{username}-renamed"
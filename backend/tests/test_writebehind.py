@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import writebehind
+from rollups import rollup_rows
+from writebehind import MoodWriteBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+async def _user_id(client, headers):
+    return (await client.get("/users/me", headers=headers)).json()["id"]
+
+
+async def test_write_behind_resolves_futures_and_drains(client, make_user):
+    _, headers = await make_user()
+    user_id = (await client.get("/users/me", headers=headers)).json()["id"]
+    buffer = MoodWriteBuffer(max_batch=100, interval_ms=50)
+    buffer.start()
+    writebehind.buffer = buffer
+    try:
+        responses = await asyncio.gather(*(
+            client.post("/mood", json={"mood": "ok", "details": f"note {index}"}, headers=headers) for index in range(5)
+        ))
+        assert all(response.status_code == 200 for response in responses)
+        assert len({response.json()["id"] for response in responses}) == 5
+        assert buffer.stats()["flushes"] == 1
+
+        # drain дописывает всё, что уже в очереди, и закрывает буфер
+        pending = [asyncio.create_task(buffer.submit(user_id, "calm", None)) for _ in range(3)]
+        await asyncio.sleep(0)
+        await buffer.drain()
+        assert all(task.done() and task.result().id for task in pending)
+        with pytest.raises(RuntimeError):
+            await buffer.submit(user_id, "calm", None)
+    finally:
+        writebehind.buffer = None
+        await buffer.drain()
+
+    history = (await client.get("/mood", headers=headers)).json()
+    assert len(history["items"]) == 8
+
+
+async def test_flusher_survives_errors_after_commit(client, make_user, monkeypatch):
+    _, headers = await make_user()
+    user_id = await _user_id(client, headers)
+
+    def broken_index(*args):
+        raise RuntimeError("search index is broken")
+
+    monkeypatch.setattr(writebehind, "index_mood_entry", broken_index)
+    buffer = MoodWriteBuffer(interval_ms=1)
+    buffer.start()
+    try:
+        # строка закоммичена, поэтому запрос всё равно получает запись
+        entry = await buffer.submit(user_id, "ok", "note")
+        assert entry.id is not None
+        assert buffer.accepting
+        assert (await buffer.submit(user_id, "ok", "again")).id > entry.id
+    finally:
+        await buffer.drain()
+
+
+async def test_dead_flusher_fails_waiters_and_stops_accepting(client, make_user, monkeypatch):
+    _, headers = await make_user()
+    user_id = await _user_id(client, headers)
+    buffer = MoodWriteBuffer(interval_ms=1)
+
+    async def crash(batch):
+        raise KeyError("unexpected")
+
+    monkeypatch.setattr(buffer, "_flush", crash)
+    buffer.start()
+    writebehind.buffer = buffer
+    try:
+        results = await asyncio.wait_for(asyncio.gather(
+            *(buffer.submit(user_id, "ok", None) for _ in range(3)), return_exceptions=True,
+        ), timeout=5)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert not buffer.accepting
+        # без флашера POST /mood пишет напрямую, а не ждёт вечно
+        response = await asyncio.wait_for(client.post("/mood", json={"mood": "ok"}, headers=headers), timeout=5)
+        assert response.status_code == 200
+    finally:
+        writebehind.buffer = None
+        await buffer.drain()
+
+
+async def test_full_queue_returns_503(client, make_user):
+    _, headers = await make_user()
+    user_id = await _user_id(client, headers)
+    # длинный интервал: записи лежат в очереди, пока их не сбросит drain
+    buffer = MoodWriteBuffer(interval_ms=60_000, max_queue=2)
+    buffer.start()
+    writebehind.buffer = buffer
+    try:
+        waiting = [asyncio.create_task(buffer.submit(user_id, "ok", None)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await buffer.submit(user_id, "ok", None)
+        assert error.value.status_code == 503
+        response = await client.post("/mood", json={"mood": "ok"}, headers=headers)
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert buffer.stats()["rejected"] == 2
+    finally:
+        writebehind.buffer = None
+        await buffer.drain()
+    assert all(task.result().id for task in waiting)
+
+
+def test_rollup_rows_are_sorted_by_key():
+    day = datetime(2026, 6, 1, 12)
+    rows = rollup_rows([(2, "sad", day), (1, "ok", day.replace(day=2)), (1, "ok", day), (2, "bad", day), (1, "ok", day)])
+    assert [(row["user_id"], row["day"].isoformat(), row["mood"], row["count"]) for row in rows] == [
+        (1, "2026-06-01", "ok", 2), (1, "2026-06-02", "ok", 1), (2, "2026-06-01", "bad", 1), (2, "2026-06-01", "sad", 1),
+    ]
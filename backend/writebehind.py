@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import insert
+from database import AsyncSessionLocal, env_flag
+from models import MoodEntry
+from rollups import apply_mood_rollups_many
+from search import index_mood_entry
+
+logger = logging.getLogger(__name__)
+
+# Групповая запись настроений (включается явно): POST /mood кладёт запись
+# в очередь, фоновая задача пишет накопленное одним INSERT ... RETURNING
+# и одним коммитом раз в MOOD_FLUSH_INTERVAL_MS или по MOOD_FLUSH_MAX_BATCH записей
+MOOD_WRITE_BEHIND = env_flag("MOOD_WRITE_BEHIND", False)
+MOOD_FLUSH_INTERVAL_MS = float(os.getenv("MOOD_FLUSH_INTERVAL_MS", "5"))
+MOOD_FLUSH_MAX_BATCH = int(os.getenv("MOOD_FLUSH_MAX_BATCH", "500"))
+# Сверх стольких записей в очереди отвечаем 503: если база тормозит, очередь не растёт без предела
+MOOD_WRITE_MAX_QUEUE = int(os.getenv("MOOD_WRITE_MAX_QUEUE", "5000"))
+
+class MoodWriteBuffer:
+    def __init__(self, session_factory=AsyncSessionLocal, max_batch: int = MOOD_FLUSH_MAX_BATCH,
+                 interval_ms: float = MOOD_FLUSH_INTERVAL_MS, max_queue: int = MOOD_WRITE_MAX_QUEUE):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.interval = interval_ms / 1000
+        self.max_queue = max_queue
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._in_flight: List[Tuple[dict, asyncio.Future]] = []
+        self._has_pending = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.accepting = False
+        self.flushes = 0
+        self.rows = 0
+        self.max_flush_rows = 0
+        self.rejected = 0
+
+    # Ставит запись в очередь и ждёт, пока её строка будет закоммичена
+    async def submit(self, user_id: int, mood: str, details: Optional[str]) -> MoodEntry:
+        if not self.accepting:
+            raise RuntimeError("Mood write buffer is closed")
+        if len(self._pending) >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": "1"},
+            )
+        future = asyncio.get_running_loop().create_future()
+        row = {"user_id": user_id, "mood": mood, "details": details, "timestamp": datetime.utcnow()}
+        self._pending.append((row, future))
+        self._has_pending.set()
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        rows = [row for row, _ in batch]
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    insert(MoodEntry).returning(MoodEntry.id, sort_by_parameter_order=True), rows
+                )
+                ids = result.scalars().all()
+                await apply_mood_rollups_many(session, ((row["user_id"], row["mood"], row["timestamp"]) for row in rows))
+                await session.commit()
+        except Exception as exc:
+            logger.exception("Failed to flush %s mood entries", len(batch))
+            _fail(batch, exc)
+            return
+
+        self.flushes += 1
+        self.rows += len(rows)
+        self.max_flush_rows = max(self.max_flush_rows, len(rows))
+        # Строки уже закоммичены: сначала отвечаем ожидающим, потом обновляем
+        # индекс поиска. Ошибка здесь не должна убить флашер.
+        try:
+            for entry_id, (row, future) in zip(ids, batch):
+                if not future.done():
+                    future.set_result(MoodEntry(id=entry_id, **row))
+            for entry_id, row in zip(ids, rows):
+                index_mood_entry(row["user_id"], entry_id, row["timestamp"], row["details"])
+        except Exception as exc:
+            logger.exception("Failed to finish flush of %s mood entries", len(batch))
+            _fail(batch, exc)
+
+    async def run(self):
+        try:
+            await self._run()
+        except Exception:
+            logger.exception("Mood write-behind flusher failed, falling back to direct inserts")
+        finally:
+            # Без флашера очередь никто не разберёт: новые записи идут мимо
+            # буфера, а уже ожидающие получают ошибку вместо вечного ожидания
+            self.accepting = False
+            pending, self._pending, self._in_flight = self._in_flight + self._pending, [], []
+            _fail(pending, RuntimeError("Mood write buffer is closed"))
+
+    async def _run(self):
+        while self.accepting or self._pending:
+            await self._has_pending.wait()
+            # Ждём, пока наберётся пачка, но не дольше интервала
+            if self.accepting and len(self._pending) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            if len(self._pending) < self.max_batch:
+                self._full.clear()
+            if not self._pending:
+                self._has_pending.clear()
+            if batch:
+                self._in_flight = batch
+                await self._flush(batch)
+                self._in_flight = []
+
+    def start(self):
+        if self._task is None:
+            self.accepting = True
+            self._task = asyncio.create_task(self.run())
+
+    # Перестаёт принимать записи и дописывает всё, что уже в очереди
+    async def drain(self):
+        if self._task is None:
+            return
+        self.accepting = False
+        self._has_pending.set()
+        self._full.set()
+        await self._task
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._pending),
+            "flushes": self.flushes,
+            "rows": self.rows,
+            "max_flush_rows": self.max_flush_rows,
+            "rejected": self.rejected,
+        }
+
+def _fail(batch: List[Tuple[dict, asyncio.Future]], exc: BaseException):
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(exc)
+
+buffer: Optional[MoodWriteBuffer] = None
+
+def start_write_behind():
+    global buffer
+    if MOOD_WRITE_BEHIND and buffer is None:
+        buffer = MoodWriteBuffer()
+        buffer.start()
+        logger.info("Mood write-behind enabled: every %s ms or %s entries", MOOD_FLUSH_INTERVAL_MS, MOOD_FLUSH_MAX_BATCH)
+
+async def stop_write_behind():
+    global buffer
+    if buffer is not None:
+        await buffer.drain()
+        buffer = None